@@ -1,4 +1,5 @@
 from langchain_mcp_adapters.client import MultiServerMCPClient
+from langchain_mcp_adapters.tools import load_mcp_tools
 from langgraph.prebuilt import create_react_agent
 from langchain_groq import ChatGroq
 
@@ -28,35 +29,37 @@ async def main():
 
     os.environ["GROQ_API_KEY"] = os.getenv("GROQ_API_KEY")
 
-    tools = await client.get_tools()
-    model = ChatGroq(model="qwen/qwen3-32b")
-    agent = create_react_agent(model, tools)
+    # Giữ một session cho cả lượt chạy thay vì mở kết nối mới cho mỗi lần gọi tool
+    async with client.session("weather") as session:
+        tools = await load_mcp_tools(session)
+        model = ChatGroq(model="qwen/qwen3-32b")
+        agent = create_react_agent(model, tools)
 
-    # math_response = await agent.ainvoke(
-    #     {"messages": [{"role": "user", "content": "what's (3 + 5) x 12?"}]}
-    # )
+        # math_response = await agent.ainvoke(
+        #     {"messages": [{"role": "user", "content": "what's (3 + 5) x 12?"}]}
+        # )
 
-    # print("Math response:", math_response['messages'][-1].content)
+        # print("Math response:", math_response['messages'][-1].content)
 
-    weather_response = await agent.ainvoke(
-        {
-            "messages": [
-                {
-                    "role": "system",
-                    "content": 'Bạn là một trợ lý bán nước hoa. Bạn có thể truy vấn thông tin về các sản phẩm nước hoa và hỗ trợ khách hàng trong quá trình chọn mua.\n\
+        weather_response = await agent.ainvoke(
+            {
+                "messages": [
+                    {
+                        "role": "system",
+                        "content": 'Bạn là một trợ lý bán nước hoa. Bạn có thể truy vấn thông tin về các sản phẩm nước hoa và hỗ trợ khách hàng trong quá trình chọn mua.\n\
 Bạn được cấp quyền sử dụng hai công cụ:\n\
 - `tavily_web_search`: chỉ được dùng khi cần tìm kiếm thông tin trên web liên quan đến mua bán, đánh giá, hoặc xu hướng thị trường nước hoa.\n\
 - `get_product_variations`: dùng để truy vấn thông tin chi tiết về sản phẩm nước hoa như mùi hương, giá, hình ảnh, liên kết mua hàng, stock,...\n\
 Hãy xưng hô là "em" và gọi người dùng là "anh/chị" tùy theo ngữ cảnh.',
-                },
-                {
-                    "role": "user",
-                    "content": 'tìm cho tôi thông tin sản phẩm "Lancôme Tresor La Nuit EDP" và bản tester còn hàng không ? /no_think',
-                },
-            ]
-        }
-    )
-    print("Response:", weather_response["messages"][-1].content)
+                    },
+                    {
+                        "role": "user",
+                        "content": 'tìm cho tôi thông tin sản phẩm "Lancôme Tresor La Nuit EDP" và bản tester còn hàng không ? /no_think',
+                    },
+                ]
+            }
+        )
+        print("Response:", weather_response["messages"][-1].content)
 
 
 asyncio.run(main())
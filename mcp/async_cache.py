@@ -0,0 +1,79 @@
+"""
+Small asyncio caching helpers shared by the MCP server tools.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+
+class CacheEntry:
+    __slots__ = ("value", "expires_at", "etag")
+
+    def __init__(self, value: Any, expires_at: float, etag: Optional[str] = None):
+        self.value = value
+        self.expires_at = expires_at
+        self.etag = etag
+
+    @property
+    def fresh(self) -> bool:
+        return time.monotonic() < self.expires_at
+
+
+class TTLCache:
+    """
+    LRU cache with a time-to-live per entry.
+
+    Expired entries are kept (up to maxsize) so callers can revalidate them
+    with their ETag instead of refetching the full payload.
+    """
+
+    def __init__(self, ttl: float, maxsize: int = 1024):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Hashable, CacheEntry]" = OrderedDict()
+
+    def get_entry(self, key: Hashable) -> Optional[CacheEntry]:
+        entry = self._data.get(key)
+        if entry is not None:
+            self._data.move_to_end(key)
+        return entry
+
+    def get(self, key: Hashable) -> Any:
+        """Return the cached value if it is still fresh, else None."""
+        entry = self.get_entry(key)
+        if entry is not None and entry.fresh:
+            return entry.value
+        return None
+
+    def set(self, key: Hashable, value: Any, etag: Optional[str] = None):
+        self._data[key] = CacheEntry(value, time.monotonic() + self.ttl, etag)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def touch(self, key: Hashable):
+        """Extend the lifetime of an entry that the server confirmed unchanged."""
+        entry = self._data.get(key)
+        if entry is not None:
+            entry.expires_at = time.monotonic() + self.ttl
+
+    def clear(self):
+        self._data.clear()
+
+
+class InFlight:
+    """Deduplicate concurrent calls: callers with the same key share one task."""
+
+    def __init__(self):
+        self._pending: Dict[Hashable, asyncio.Future] = {}
+
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._pending.get(key)
+        if future is None:
+            future = asyncio.ensure_future(factory())
+            self._pending[key] = future
+            future.add_done_callback(lambda _: self._pending.pop(key, None))
+        # shield: một caller bị cancel không được hủy request của các caller khác
+        return await asyncio.shield(future)
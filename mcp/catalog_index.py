@@ -0,0 +1,229 @@
+"""
+In-process index of the WooCommerce catalog (id, name, slug, variation ids).
+
+Lets the MCP server resolve the agent's free-text product names locally with
+accent-insensitive fuzzy matching instead of an exact `?slug=` round trip.
+The index is refreshed by a background task, never on the tool call path.
+"""
+
+import asyncio
+import html
+import os
+import re
+import time
+import unicodedata
+from dataclasses import dataclass, field
+from difflib import SequenceMatcher
+from typing import Dict, List, Optional
+from urllib.parse import unquote
+
+from woo_client import WooCommerceClient
+
+# Các cách viết khác nhau của cùng một nồng độ nước hoa
+NAME_ALIASES = [
+    (r"\beau de parfum\b", "edp"),
+    (r"\beau de toilette\b", "edt"),
+    (r"\beau de cologne\b", "edc"),
+    (r"\bextrait de parfum\b", "extrait"),
+]
+
+CONCENTRATIONS = frozenset(alias for _, alias in NAME_ALIASES) | {"parfum"}
+
+# Dung tích ("100ml", "100 ml"): không phân biệt hai sản phẩm cùng tên
+_SIZE_RE = re.compile(r"\d+(ml)?|ml")
+
+PRODUCT_FIELDS = "id,name,slug,variations,date_modified_gmt"
+
+
+def normalize_name(name: str) -> str:
+    """Lowercase, strip accents and HTML/URL encoding, and unify aliases."""
+    name = html.unescape(unquote(name))
+    name = name.replace("đ", "d").replace("Đ", "D")
+    name = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode("utf-8")
+    name = name.lower()
+    name = re.sub(r"[^a-z0-9]+", " ", name).strip()
+    for pattern, alias in NAME_ALIASES:
+        name = re.sub(pattern, alias, name)
+    return name
+
+
+def _token_matches(token: str, candidates: frozenset) -> bool:
+    """Exact match, or a small typo in a word (numbers must match exactly)."""
+    if token in candidates:
+        return True
+    if token.isdigit() or len(token) < 4:
+        return False
+    return any(
+        not other.isdigit() and SequenceMatcher(None, token, other).ratio() >= 0.85
+        for other in candidates
+    )
+
+
+def _is_detail(token: str) -> bool:
+    """Concentration or size: the rest of a name the query can leave out."""
+    return token in CONCENTRATIONS or _SIZE_RE.fullmatch(token) is not None
+
+
+@dataclass
+class CatalogEntry:
+    id: int
+    name: str
+    slug: str
+    variation_ids: List[int] = field(default_factory=list)
+    key: str = ""
+    tokens: frozenset = frozenset()
+
+
+class CatalogIndex:
+    """
+    Catalog index built by bulk-paginating /products and refreshed
+    incrementally with `modified_after`.
+    """
+
+    def __init__(
+        self,
+        refresh_interval: Optional[float] = None,
+        full_rebuild_interval: Optional[float] = None,
+    ):
+        if refresh_interval is None:
+            refresh_interval = float(os.getenv("CATALOG_REFRESH_SECONDS", "300"))
+        if full_rebuild_interval is None:
+            full_rebuild_interval = float(os.getenv("CATALOG_FULL_REBUILD_SECONDS", "86400"))
+        self.refresh_interval = refresh_interval
+        self.full_rebuild_interval = full_rebuild_interval
+        self._by_id: Dict[int, CatalogEntry] = {}
+        self._by_slug: Dict[str, CatalogEntry] = {}
+        self._by_key: Dict[str, CatalogEntry] = {}
+        self._last_modified: Optional[str] = None
+        self._refreshed_at = 0.0
+        self._built_at = 0.0
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def _add(self, product: dict):
+        old = self._by_id.get(product["id"])
+        if old is not None:
+            self._by_slug.pop(old.slug, None)
+            self._by_key.pop(old.key, None)
+        key = normalize_name(product["name"])
+        entry = CatalogEntry(
+            id=product["id"],
+            name=html.unescape(product["name"]),
+            slug=product["slug"],
+            variation_ids=list(product.get("variations") or []),
+            key=key,
+            tokens=frozenset(key.split()),
+        )
+        self._by_id[entry.id] = entry
+        self._by_slug[entry.slug] = entry
+        self._by_key[key] = entry
+        modified = product.get("date_modified_gmt")
+        if modified and (self._last_modified is None or modified > self._last_modified):
+            self._last_modified = modified
+
+    async def _fetch_all(self, client: WooCommerceClient, params: dict) -> List[dict]:
+        params = {"per_page": 100, "_fields": PRODUCT_FIELDS, **params}
+        first, headers = await client.get_json("/products", {**params, "page": 1}, use_cache=False)
+        total_pages = int(headers.get("X-WP-TotalPages", 1) or 1)
+        pages = await asyncio.gather(*(
+            client.get_json("/products", {**params, "page": page}, use_cache=False)
+            for page in range(2, total_pages + 1)
+        ))
+        products = list(first)
+        for data, _ in pages:
+            products.extend(data)
+        return products
+
+    async def build(self, client: WooCommerceClient):
+        """Load the whole catalog."""
+        products = await self._fetch_all(client, {})
+        self._by_id.clear()
+        self._by_slug.clear()
+        self._by_key.clear()
+        self._last_modified = None
+        for product in products:
+            self._add(product)
+        self._built_at = self._refreshed_at = time.monotonic()
+        print(f"[CATALOG] Indexed {len(self._by_id)} products")
+
+    async def refresh(self, client: WooCommerceClient):
+        """Apply products modified since the last build/refresh."""
+        if not self._by_id or time.monotonic() - self._built_at > self.full_rebuild_interval:
+            # Rebuild toàn bộ định kỳ để loại bỏ sản phẩm đã bị xóa
+            await self.build(client)
+            return
+        params = {"dates_are_gmt": "true"}
+        if self._last_modified:
+            params["modified_after"] = self._last_modified
+        products = await self._fetch_all(client, params)
+        for product in products:
+            self._add(product)
+        self._refreshed_at = time.monotonic()
+
+    async def ensure_fresh(self, client: WooCommerceClient):
+        """
+        Start a background refresh if the index is older than refresh_interval.
+
+        Never waits for it: callers use the current index (possibly empty, then
+        they fall back to slug lookups) while the refresh runs.
+        """
+        # Chặn theo thời gian kể cả khi index rỗng (warm-up lỗi, API đang sập)
+        if time.monotonic() - self._refreshed_at < self.refresh_interval:
+            return
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh_in_background(client))
+
+    async def _refresh_in_background(self, client: WooCommerceClient):
+        try:
+            await self.refresh(client)
+        except Exception as e:
+            print(f"[CATALOG] Refresh failed: {e}")
+            # Tránh retry liên tục khi API lỗi: thử lại sau refresh_interval
+            self._refreshed_at = time.monotonic()
+
+    def resolve(self, query: str, max_candidates: int = 5) -> List[CatalogEntry]:
+        """
+        Return the products matching a free-text name or slug.
+
+        One entry means a confident match; several entries mean the query is
+        ambiguous (e.g. just a brand) and the caller should ask which one is meant.
+        Every query token must appear in the product name (small typos allowed),
+        and concentrations (EDP/EDT/...) must match exactly. When several products
+        match, one is only picked if the query names it fully, i.e. leaves out at
+        most its concentration or size.
+        """
+        entry = self._by_slug.get(query.strip().lower())
+        if entry is not None:
+            return [entry]
+        key = normalize_name(query)
+        if not key:
+            return []
+        entry = self._by_key.get(key)
+        if entry is not None:
+            return [entry]
+
+        tokens = frozenset(key.split())
+        concentration = tokens & CONCENTRATIONS
+        scored = []
+        for candidate in self._by_id.values():
+            # Nồng độ là ràng buộc cứng: EDP và EDT là hai sản phẩm khác nhau
+            if concentration and candidate.tokens & CONCENTRATIONS != concentration:
+                continue
+            if not all(_token_matches(token, candidate.tokens) for token in tokens):
+                continue
+            extra = [token for token in candidate.tokens if not _token_matches(token, tokens)]
+            # Càng ít từ thừa so với query càng khớp; hòa điểm thì ưu tiên tên gần giống về ký tự
+            coverage = len(tokens) / len(tokens | candidate.tokens)
+            ratio = SequenceMatcher(None, key, candidate.key).ratio()
+            scored.append(((coverage, ratio), all(_is_detail(t) for t in extra), candidate))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        if len(scored) <= 1:
+            return [candidate for _, _, candidate in scored]
+        # Query chứa đủ tên của đúng một sản phẩm thì chọn nó; chỉ là tập con của nhiều
+        # tên (vd. "Lancome", "Dior Sauvage") thì trả về tất cả để hỏi lại
+        named = [candidate for _, full, candidate in scored if full]
+        if len(named) == 1:
+            return named
+        return [candidate for _, _, candidate in scored][:max_candidates]
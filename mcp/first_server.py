@@ -2,21 +2,33 @@ from mcp.server.fastmcp import FastMCP
 # import getdotenv
 from dotenv import load_dotenv
 import os
-import requests
-from requests.auth import HTTPBasicAuth
 import re
 import unicodedata
 from urllib.parse import unquote 
-from tavily import TavilyClient
+from tavily import AsyncTavilyClient
+from woo_client import WooCommerceClient, WooCommerceError
+from catalog_index import CatalogIndex
+from async_cache import InFlight, TTLCache
+import asyncio
 
 load_dotenv()
 
-CONSUMER_KEY = os.getenv("CONSUMER_KEY")
-CONSUMER_SECRET = os.getenv("CONSUMER_SECRET")
-
 # Create an MCP server
 mcp = FastMCP("Muse", port=8001)
 
+# Shared WooCommerce client (pooled connections + response cache)
+woo = WooCommerceClient()
+
+# Local name/slug index, resolves product names without a slug round trip
+catalog = CatalogIndex()
+
+# Web search: reused client, result cache keyed on the normalized query
+tavily_client = None
+search_cache = TTLCache(ttl=float(os.getenv("TAVILY_CACHE_TTL", "3600")), maxsize=512)
+search_inflight = InFlight()
+SEARCH_MAX_RESULTS = int(os.getenv("TAVILY_MAX_RESULTS", "3"))
+SEARCH_MAX_CHARS = int(os.getenv("TAVILY_MAX_CHARS", "2000"))
+
 # Tool implementation
 def slugify(name: str) -> str:
     """Convert product name (possibly URL encoded) to WooCommerce-style slug."""
@@ -32,47 +44,60 @@ def slugify(name: str) -> str:
 async def get_product_variations(product_slug: str) -> str:
     # Step 1: Get product by slug
     """
-    Retrieves product variations using a product slug.
+    Retrieves product variations using a product name or slug.
 
-    The function first fetches the product details based on the provided slug.
+    The name is resolved against the local catalog index (accent-insensitive,
+    tolerant of small typos), falling back to an exact slug lookup. If the name
+    matches several products, their names are returned instead. The function
+    then fetches the product details.
     If the product is found, it fetches the product's variations using the
     product ID. It returns a formatted list of variations with attributes
     such as price, image, permalink, and stock status, along with the product
     description.
 
     Args:
-        product_slug (str): The slug of the product for which to retrieve variations.
+        product_slug (str): The name or slug of the product for which to retrieve variations.
 
     Returns:
         str: A formatted string containing details of the product variations
              or an error message if the product or its variations cannot be fetched.
     """
 
-    url = "https://museperfume.vn/wp-json/wc/v3/products"
-    product_slug = slugify(product_slug)
-    params = {"slug": product_slug, "per_page": 1}
-    response = requests.get(url, auth=HTTPBasicAuth(CONSUMER_KEY, CONSUMER_SECRET), params=params)
-
-    if response.status_code != 200:
-        return f"Failed to fetch product. Status {response.status_code}: {response.text}"
-
-    data = response.json()
-    if not data:
+    await catalog.ensure_fresh(woo)
+    matches = catalog.resolve(product_slug)
+    if len(matches) > 1:
+        # Không tự chọn một sản phẩm khi tên chưa đủ rõ (vd. chỉ có thương hiệu)
+        names = "; ".join(f"'{m.name}'" for m in matches)
+        return (
+            f"Multiple products match '{product_slug}': {names}. "
+            "Call again with the exact product name."
+        )
+    entry = matches[0] if matches else None
+    try:
+        if entry is not None:
+            product = await woo.get_product(entry.id)
+        else:
+            # Fallback: tra cứu trực tiếp theo slug
+            product_slug = slugify(product_slug)
+            product = await woo.get_product_by_slug(product_slug)
+    except WooCommerceError as e:
+        return f"Failed to fetch product. Status {e.status_code}: {e.text}"
+
+    if not product:
         return f"No product found with slug: '{product_slug}'"
 
-    product = data[0]
     product_id = product["id"]
     product_name = product["name"]
     product_description = product.get("description")
 
     # Step 2: Get variations by product ID
-    variations_url = f"https://museperfume.vn/wp-json/wc/v3/products/{product_id}/variations"
-    variations_response = requests.get(variations_url, auth=HTTPBasicAuth(CONSUMER_KEY, CONSUMER_SECRET))
-
-    if variations_response.status_code != 200:
-        return f"Failed to fetch variations. Status {variations_response.status_code}: {variations_response.text}"
+    if entry is not None and not entry.variation_ids:
+        return f"No variations found for product '{product_name}'"
+    try:
+        variations = await woo.get_variations(product_id)
+    except WooCommerceError as e:
+        return f"Failed to fetch variations. Status {e.status_code}: {e.text}"
 
-    variations = variations_response.json()
     if not variations:
         return f"No variations found for product '{product_name}'"
 
@@ -90,6 +115,37 @@ async def get_product_variations(product_slug: str) -> str:
     variation_list.append("description:" + product_description)
     return variation_list
 
+def normalize_query(query: str) -> str:
+    """Normalize a search query so trivially different spellings share a cache entry."""
+    query = unicodedata.normalize("NFC", query).lower()
+    return re.sub(r'\s+', ' ', query).strip()
+
+def format_search_results(response: dict, max_chars: int = SEARCH_MAX_CHARS) -> str:
+    """Project a Tavily response to the answer plus title/url/snippet, within a size budget."""
+    parts = []
+    answer = (response.get("answer") or "").strip()
+    if answer:
+        parts.append(f"Answer: {answer}")
+    for idx, result in enumerate(response.get("results", [])[:SEARCH_MAX_RESULTS]):
+        content = re.sub(r'\s+', ' ', result.get("content") or "").strip()
+        parts.append(f"[{idx+1}] {result.get('title', '')}\n{result.get('url', '')}\n{content}")
+
+    output = ""
+    for part in parts:
+        remaining = max_chars - len(output)
+        if remaining <= 0:
+            break
+        if len(part) > remaining:
+            part = part[:max(remaining - 3, 0)].rsplit(" ", 1)[0] + "..."
+        output += part + "\n\n"
+    return output.strip() or "No results found."
+
+def get_tavily_client(api_key: str) -> AsyncTavilyClient:
+    global tavily_client
+    if tavily_client is None:
+        tavily_client = AsyncTavilyClient(api_key=api_key)
+    return tavily_client
+
 @mcp.tool()
 async def tavily_web_search(query: str) -> str:
     """
@@ -99,20 +155,46 @@ async def tavily_web_search(query: str) -> str:
         query (str): The search query string.
 
     Returns:
-        str: The search result from Tavily API. If the API key is not set, 
-        returns an error message prompting to set TAVILY_API_KEY.
+        str: A compact summary of the search results (answer, then title, URL and
+        snippet of the top results). If the API key is not set, returns an error
+        message prompting to set TAVILY_API_KEY.
     """
 
     api_key = os.getenv("TAVILY_API_KEY")
 
     if not api_key:
         return "Tavily API key not set. Please set TAVILY_API_KEY in your environment."
-    client = TavilyClient(api_key=api_key)
-
-    response = client.search(query, limit=2, search_depth="advanced", include_answer=True)
 
-    return response
+    key = normalize_query(query)
+    cached = search_cache.get(key)
+    if cached is not None:
+        return cached
+
+    async def search():
+        client = get_tavily_client(api_key)
+        response = await client.search(
+            query,
+            max_results=SEARCH_MAX_RESULTS,
+            search_depth="advanced",
+            include_answer=True,
+        )
+        result = format_search_results(response)
+        search_cache.set(key, result)
+        return result
+
+    return await search_inflight.run(key, search)
+
+async def warm_up_catalog():
+    """Build the catalog index before serving, with a client bound to this loop."""
+    client = WooCommerceClient()
+    try:
+        await catalog.build(client)
+    except Exception as e:
+        print(f"[CATALOG] Initial build failed, will retry on first request: {e}")
+    finally:
+        await client.aclose()
 
 # Run the server
 if __name__ == "__main__":
+    asyncio.run(warm_up_catalog())
     mcp.run(transport='streamable-http')
\ No newline at end of file
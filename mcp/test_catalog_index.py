@@ -0,0 +1,97 @@
+"""
+Tests for CatalogIndex name resolution and refresh scheduling (no WooCommerce API needed).
+
+Run with: python -m pytest mcp/test_catalog_index.py
+"""
+
+import asyncio
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from catalog_index import CatalogIndex  # noqa: E402
+
+PRODUCTS = [
+    (1, "Dior Sauvage Eau de Parfum", "dior-sauvage-edp"),
+    (2, "Dior Sauvage Eau de Toilette", "dior-sauvage-edt"),
+    (3, "Dior Sauvage Elixir", "dior-sauvage-elixir"),
+    (4, "Lancôme Trésor Eau de Parfum", "lancome-tresor-edp"),
+    (5, "Lancôme Trésor La Nuit Eau de Parfum", "lancome-tresor-la-nuit-edp"),
+    (6, "Lancôme La Vie Est Belle Eau de Parfum", "lancome-la-vie-est-belle-edp"),
+    (7, "Chanel Chance Eau Tendre EDT 100ml", "chanel-chance-eau-tendre"),
+    (8, "Chanel No 5 Eau de Parfum", "chanel-no-5-edp"),
+]
+
+
+def build_index() -> CatalogIndex:
+    index = CatalogIndex(refresh_interval=300, full_rebuild_interval=86400)
+    for product_id, name, slug in PRODUCTS:
+        index._add({"id": product_id, "name": name, "slug": slug, "variations": [product_id * 10]})
+    index._refreshed_at = index._built_at = time.monotonic()
+    return index
+
+
+class ResolveTest(unittest.TestCase):
+    def setUp(self):
+        self.index = build_index()
+
+    def ids(self, query):
+        return [entry.id for entry in self.index.resolve(query)]
+
+    def test_slug_and_exact_name(self):
+        self.assertEqual(self.ids("dior-sauvage-edt"), [2])
+        self.assertEqual(self.ids("Lancome Tresor Eau de Parfum"), [4])
+
+    def test_concentration_is_a_hard_constraint(self):
+        self.assertEqual(self.ids("Dior Sauvage EDP"), [1])
+        self.assertEqual(self.ids("sauvage eau de toilette"), [2])
+        self.assertEqual(self.ids("Chanel No 5 EDT"), [])
+
+    def test_bare_brand_is_ambiguous(self):
+        self.assertCountEqual(self.ids("Lancome"), [4, 5, 6])
+        self.assertCountEqual(self.ids("Dior Sauvage"), [1, 2, 3])
+
+    def test_full_name_without_concentration_or_size(self):
+        # Trésor khớp đủ tên (chỉ thiếu EDP); Trésor La Nuit còn thừa "la nuit"
+        self.assertEqual(self.ids("Lancome Tresor"), [4])
+        self.assertEqual(self.ids("chanel chance eau tendre"), [7])
+
+    def test_query_tokens_must_all_match(self):
+        self.assertEqual(self.ids("chanel no 19 edp"), [])
+        self.assertEqual(self.ids("Tom Ford Oud Wood"), [])
+
+    def test_small_typos(self):
+        self.assertEqual(self.ids("Lancome Tressor La Nuit"), [5])
+
+    def test_max_candidates(self):
+        self.assertEqual(len(self.index.resolve("Lancome", max_candidates=2)), 2)
+
+
+class EnsureFreshTest(unittest.TestCase):
+    def test_failed_refresh_is_throttled_and_runs_in_background(self):
+        index = CatalogIndex(refresh_interval=300, full_rebuild_interval=86400)
+        calls = []
+
+        async def failing_refresh(client):
+            calls.append(client)
+            raise RuntimeError("API down")
+
+        index.refresh = failing_refresh
+
+        async def scenario():
+            # Index rỗng: lần đầu lên lịch refresh chạy nền, không chờ
+            await index.ensure_fresh("client")
+            self.assertEqual(calls, [])
+            await index._refresh_task
+            for _ in range(3):
+                await index.ensure_fresh("client")
+            await asyncio.sleep(0)
+
+        asyncio.run(scenario())
+        self.assertEqual(calls, ["client"])
+
+
+if __name__ == "__main__":
+    unittest.main()
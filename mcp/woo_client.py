@@ -0,0 +1,134 @@
+"""
+Pooled async client for the WooCommerce REST API used by the MCP server.
+"""
+
+import asyncio
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from async_cache import InFlight, TTLCache
+
+WOOCOMMERCE_URL = "https://museperfume.vn/wp-json/wc/v3"
+
+
+class WooCommerceError(Exception):
+    """Raised when the WooCommerce API answers with an unexpected status."""
+
+    def __init__(self, status_code: int, text: str):
+        super().__init__(f"Status {status_code}: {text}")
+        self.status_code = status_code
+        self.text = text
+
+
+class WooCommerceClient:
+    """
+    Async WooCommerce client with keep-alive pooling, a TTL response cache
+    revalidated through ETag/If-None-Match, and in-flight deduplication.
+    """
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        consumer_key: Optional[str] = None,
+        consumer_secret: Optional[str] = None,
+        cache_ttl: Optional[float] = None,
+        timeout: float = 15.0,
+        max_connections: int = 10,
+    ):
+        self.base_url = (base_url or os.getenv("WOOCOMMERCE_URL", WOOCOMMERCE_URL)).rstrip("/")
+        self.consumer_key = consumer_key or os.getenv("CONSUMER_KEY")
+        self.consumer_secret = consumer_secret or os.getenv("CONSUMER_SECRET")
+        if cache_ttl is None:
+            cache_ttl = float(os.getenv("WOOCOMMERCE_CACHE_TTL", "300"))
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self._cache = TTLCache(ttl=cache_ttl, maxsize=2048)
+        self._inflight = InFlight()
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # Tạo lazily để client gắn với event loop đang chạy server
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                auth=httpx.BasicAuth(self.consumer_key or "", self.consumer_secret or ""),
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+            )
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def get_json(
+        self, path: str, params: Optional[Dict[str, Any]] = None, use_cache: bool = True
+    ) -> Tuple[Any, Dict[str, str]]:
+        """
+        GET a WooCommerce endpoint.
+
+        Returns:
+            (data, headers): the decoded JSON body and the pagination headers.
+        """
+        key = (path, tuple(sorted((params or {}).items())))
+        if use_cache:
+            cached = self._cache.get(key)
+            if cached is not None:
+                return cached
+        return await self._inflight.run(key, lambda: self._fetch(key, path, params, use_cache))
+
+    async def _fetch(self, key, path: str, params: Optional[Dict[str, Any]], use_cache: bool):
+        headers = {}
+        entry = self._cache.get_entry(key) if use_cache else None
+        if entry is not None and entry.etag:
+            headers["If-None-Match"] = entry.etag
+
+        response = await self._get_client().get(path, params=params, headers=headers)
+        if response.status_code == 304 and entry is not None:
+            self._cache.touch(key)
+            return entry.value
+        if response.status_code != 200:
+            raise WooCommerceError(response.status_code, response.text)
+
+        result = (
+            response.json(),
+            {
+                name: response.headers[name]
+                for name in ("X-WP-Total", "X-WP-TotalPages")
+                if name in response.headers
+            },
+        )
+        if use_cache:
+            self._cache.set(key, result, etag=response.headers.get("ETag"))
+        return result
+
+    async def get_product_by_slug(self, slug: str) -> Optional[Dict[str, Any]]:
+        data, _ = await self.get_json("/products", {"slug": slug, "per_page": 1})
+        return data[0] if data else None
+
+    async def get_product(self, product_id: int) -> Dict[str, Any]:
+        data, _ = await self.get_json(f"/products/{product_id}")
+        return data
+
+    async def get_variations(self, product_id: int, per_page: int = 100) -> List[Dict[str, Any]]:
+        """Fetch all variations of a product; pages after the first are fetched concurrently."""
+        path = f"/products/{product_id}/variations"
+        first, headers = await self.get_json(path, {"per_page": per_page, "page": 1})
+        total_pages = int(headers.get("X-WP-TotalPages", 1) or 1)
+        if total_pages <= 1:
+            return list(first)
+
+        rest = await asyncio.gather(*(
+            self.get_json(path, {"per_page": per_page, "page": page})
+            for page in range(2, total_pages + 1)
+        ))
+        variations = list(first)
+        for data, _ in rest:
+            variations.extend(data)
+        return variations
@@ -2,11 +2,13 @@
 This module defines a Pipe class for OpenWebUI
 """
 
-from typing import Optional, Callable, Awaitable
+from typing import Optional, Callable, Awaitable, AsyncGenerator
 from pydantic import BaseModel, Field
+import asyncio
+import json
 import os
 import time
-import requests
+import httpx
 
 def extract_event_info(event_emitter) -> tuple[Optional[str], Optional[str]]:
     if not event_emitter or not event_emitter.__closure__:
@@ -32,6 +34,19 @@ class Pipe:
         enable_status_indicator: bool = Field(
             default=True, description="Enable or disable status indicator emissions"
         )
+        connect_timeout: float = Field(
+            default=10.0, description="Seconds to wait for a connection to the backend"
+        )
+        read_timeout: float = Field(
+            default=300.0, description="Seconds to wait for the backend to reply"
+        )
+        max_connections: int = Field(
+            default=20, description="Maximum pooled connections to the backend"
+        )
+        enable_streaming: bool = Field(
+            default=True,
+            description="Pass through an SSE token stream when the backend offers one",
+        )
 
     def __init__(self):
         self.type = "pipe"
@@ -39,7 +54,30 @@ class Pipe:
         self.name = "N8N Pipe"
         self.valves = self.Valves()
         self.last_emit_time = 0
-        pass
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_settings = None
+
+    def get_client(self) -> httpx.AsyncClient:
+        """Return the shared keep-alive client, rebuilding it if the valves changed."""
+        settings = (
+            self.valves.connect_timeout,
+            self.valves.read_timeout,
+            self.valves.max_connections,
+        )
+        if self._client is None or self._client.is_closed or settings != self._client_settings:
+            # The old client is not closed: aclose() would cut the requests and SSE
+            # streams still using it. It is released once they drop their reference.
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(
+                    self.valves.read_timeout, connect=self.valves.connect_timeout
+                ),
+                limits=httpx.Limits(
+                    max_connections=self.valves.max_connections,
+                    max_keepalive_connections=self.valves.max_connections,
+                ),
+            )
+            self._client_settings = settings
+        return self._client
 
     async def emit_status(
         self,
@@ -69,6 +107,56 @@ class Pipe:
             )
             self.last_emit_time = current_time
 
+    async def heartbeat(
+        self,
+        __event_emitter__: Callable[[dict], Awaitable[None]],
+        message: str,
+    ):
+        """Emit an in-progress status every emit_interval until cancelled."""
+        started = time.time()
+        while True:
+            await asyncio.sleep(self.valves.emit_interval)
+            elapsed = int(time.time() - started)
+            await self.emit_status(
+                __event_emitter__, "info", f"{message} ({elapsed}s)", False
+            )
+
+    async def stream_response(
+        self,
+        response: httpx.Response,
+        __event_emitter__: Callable[[dict], Awaitable[None]],
+    ) -> AsyncGenerator[str, None]:
+        """Yield tokens from an SSE response, closing it when the stream ends."""
+        try:
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if not data or data == "[DONE]":
+                    continue
+                try:
+                    event = json.loads(data)
+                except json.JSONDecodeError:
+                    yield data
+                    continue
+                if isinstance(event, dict):
+                    token = event.get(self.valves.response_field) or event.get("content")
+                    if token:
+                        yield token
+                elif isinstance(event, str):
+                    yield event
+        except Exception as e:
+            await self.emit_status(
+                __event_emitter__,
+                "error",
+                f"Error during sequence execution: {str(e)}",
+                True,
+            )
+            raise
+        finally:
+            await response.aclose()
+        await self.emit_status(__event_emitter__, "info", "Complete", True)
+
     async def pipe(
         self,
         body: dict,
@@ -81,6 +169,7 @@ class Pipe:
         )
         chat_id, _ = extract_event_info(__event_emitter__)
         messages = body.get("messages", [])
+        n8n_response = None
 
         # Verify a message is available
         if messages:
@@ -91,11 +180,35 @@ class Pipe:
                     "Authorization": f"Bearer {self.valves.n8n_bearer_token}",
                     "Content-Type": "application/json",
                 }
+                if self.valves.enable_streaming:
+                    headers["Accept"] = "text/event-stream, application/json"
                 payload = {"sessionId": f"{chat_id}"}
                 payload[self.valves.input_field] = question
-                response = requests.post(
-                    self.valves.n8n_url, json=payload, headers=headers
+
+                # Keep the status indicator alive while the workflow runs
+                heartbeat = asyncio.create_task(
+                    self.heartbeat(__event_emitter__, "Waiting for N8N Workflow...")
                 )
+                try:
+                    client = self.get_client()
+                    request = client.build_request(
+                        "POST", self.valves.n8n_url, json=payload, headers=headers
+                    )
+                    response = await client.send(request, stream=True)
+
+                    content_type = response.headers.get("content-type", "")
+                    if response.status_code == 200 and content_type.startswith(
+                        "text/event-stream"
+                    ):
+                        # Open WebUI consumes async generators as a token stream
+                        return self.stream_response(response, __event_emitter__)
+
+                    try:
+                        await response.aread()
+                    finally:
+                        await response.aclose()
+                finally:
+                    heartbeat.cancel()
                 if response.status_code == 200:
                     n8n_response = response.json()[self.valves.response_field]
                 else:
@@ -2,9 +2,15 @@
 """
 start_services.py
 
-This script starts the Supabase stack first, waits for it to initialize, and then starts
+This script starts the Supabase stack first, waits for it to become ready, and then starts
 the local AI stack. Both stacks use the same Docker Compose project name ("localai")
 so they appear together in Docker Desktop.
+
+Independent preparation steps (Supabase repo update followed by the image pull, SearXNG
+key generation) run concurrently, and readiness is detected by polling Postgres, Kong/PostgREST and the
+container health status instead of sleeping for a fixed time.
+
+Set DOCKER_BIN to use another docker executable (e.g. a stub script when testing).
 """
 
 import os
@@ -14,12 +20,56 @@ import time
 import argparse
 import platform
 import sys
+import urllib.request
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+DOCKER = os.getenv("DOCKER_BIN", "docker")
+
+# (phase name, seconds) in the order phases finished
+PHASE_TIMINGS = []
 
 def run_command(cmd, cwd=None):
     """Run a shell command and print it."""
     print("Running:", " ".join(cmd))
     subprocess.run(cmd, cwd=cwd, check=True)
 
+@contextmanager
+def phase(name):
+    """Time a startup phase and record it for the final report."""
+    start = time.monotonic()
+    print(f"=== {name} ===")
+    try:
+        yield
+    finally:
+        PHASE_TIMINGS.append((name, time.monotonic() - start))
+
+def print_timings():
+    print("\nStartup timings:")
+    for name, seconds in PHASE_TIMINGS:
+        print(f"  {name:<32} {seconds:6.1f}s")
+    print(f"  {'total':<32} {sum(s for _, s in PHASE_TIMINGS):6.1f}s")
+
+def run_parallel(*steps):
+    """Run independent steps concurrently; re-raise the first failure after all finish."""
+    with ThreadPoolExecutor(max_workers=len(steps)) as executor:
+        futures = [executor.submit(step) for step in steps]
+    for future in futures:
+        future.result()
+
+def read_env_value(key, default=None):
+    """Read a value from the environment or the root .env file."""
+    if os.getenv(key):
+        return os.getenv(key)
+    if os.path.exists(".env"):
+        with open(".env") as file:
+            for line in file:
+                name, sep, value = line.strip().partition("=")
+                if sep and name.strip() == key:
+                    return value.strip().strip('"').strip("'")
+    return default
+
 def clone_supabase_repo():
     """Clone the Supabase repository using sparse checkout if not already present."""
     if not os.path.exists("supabase"):
@@ -28,16 +78,13 @@ def clone_supabase_repo():
             "git", "clone", "--filter=blob:none", "--no-checkout",
             "https://github.com/supabase/supabase.git"
         ])
-        os.chdir("supabase")
-        run_command(["git", "sparse-checkout", "init", "--cone"])
-        run_command(["git", "sparse-checkout", "set", "docker"])
-        run_command(["git", "checkout", "master"])
-        os.chdir("..")
+        # cwd instead of os.chdir: this step runs concurrently with others
+        run_command(["git", "sparse-checkout", "init", "--cone"], cwd="supabase")
+        run_command(["git", "sparse-checkout", "set", "docker"], cwd="supabase")
+        run_command(["git", "checkout", "master"], cwd="supabase")
     else:
         print("Supabase repository already exists, updating...")
-        os.chdir("supabase")
-        run_command(["git", "pull"])
-        os.chdir("..")
+        run_command(["git", "pull"], cwd="supabase")
 
 def prepare_supabase_env():
     """Copy .env to .env in supabase/docker."""
@@ -48,25 +95,20 @@ def prepare_supabase_env():
 
 def stop_existing_containers(profile=None):
     print("Stopping and removing existing containers for the unified project 'localai'...")
-    cmd = ["docker", "compose", "-p", "localai"]
+    cmd = [DOCKER, "compose", "-p", "localai"]
     if profile and profile != "none":
         cmd.extend(["--profile", profile])
     cmd.extend(["-f", "docker-compose.yml", "down"])
     run_command(cmd)
 
-def start_supabase(environment=None):
-    """Start the Supabase services (using its compose file)."""
-    print("Starting Supabase services...")
-    cmd = ["docker", "compose", "-p", "localai", "-f", "supabase/docker/docker-compose.yml"]
+def supabase_compose_cmd(environment=None):
+    cmd = [DOCKER, "compose", "-p", "localai", "-f", "supabase/docker/docker-compose.yml"]
     if environment and environment == "public":
         cmd.extend(["-f", "docker-compose.override.public.supabase.yml"])
-    cmd.extend(["up", "-d"])
-    run_command(cmd)
+    return cmd
 
-def start_local_ai(profile=None, environment=None):
-    """Start the local AI services (using its compose file)."""
-    print("Starting local AI services...")
-    cmd = ["docker", "compose", "-p", "localai"]
+def local_ai_compose_cmd(profile=None, environment=None):
+    cmd = [DOCKER, "compose", "-p", "localai"]
     if profile and profile != "none":
         cmd.extend(["--profile", profile])
     cmd.extend(["-f", "docker-compose.yml"])
@@ -74,8 +116,85 @@ def start_local_ai(profile=None, environment=None):
         cmd.extend(["-f", "docker-compose.override.private.yml"])
     if environment and environment == "public":
         cmd.extend(["-f", "docker-compose.override.public.yml"])
-    cmd.extend(["up", "-d"])
-    run_command(cmd)
+    return cmd
+
+def pull_images(profile=None, environment=None):
+    """Pull all images ahead of time so 'up' only has to create containers.
+
+    docker-compose.yml includes supabase/docker/docker-compose.yml, so this pulls the
+    Supabase images too and must run after the Supabase repo is in place.
+    """
+    print("Pulling images...")
+    run_command(local_ai_compose_cmd(profile, environment) + ["pull", "--quiet"])
+
+def start_supabase(environment=None):
+    """Start the Supabase services (using its compose file)."""
+    print("Starting Supabase services...")
+    run_command(supabase_compose_cmd(environment) + ["up", "-d"])
+
+def start_local_ai(profile=None, environment=None):
+    """Start the local AI services (using its compose file)."""
+    print("Starting local AI services...")
+    run_command(local_ai_compose_cmd(profile, environment) + ["up", "-d"])
+
+def container_status(name):
+    """Return the health status of a container, or its state if it has no healthcheck."""
+    result = subprocess.run(
+        [DOCKER, "inspect", "--format",
+         "{{if .State.Health}}{{.State.Health.Status}}{{else}}{{.State.Status}}{{end}}", name],
+        capture_output=True, text=True, check=False
+    )
+    return result.stdout.strip() if result.returncode == 0 else "missing"
+
+def container_ready(name):
+    return container_status(name) in ("healthy", "running")
+
+def postgres_ready(container="supabase-db"):
+    """Check that Postgres inside the Supabase db container accepts connections."""
+    result = subprocess.run(
+        [DOCKER, "exec", container, "pg_isready", "-U", "postgres", "-h", "localhost"],
+        capture_output=True, text=True, check=False
+    )
+    return result.returncode == 0
+
+def http_ready(url):
+    """A route answered by the upstream service (anything but a gateway/server error)."""
+    try:
+        with urllib.request.urlopen(url, timeout=2) as response:
+            return response.status < 500
+    except urllib.error.HTTPError as e:
+        # 401 without an API key still means Kong routed the request to PostgREST
+        return e.code < 500
+    except (urllib.error.URLError, OSError):
+        return False
+
+def wait_for(description, check, timeout, interval=1.0):
+    """Poll check() until it returns True; exit with an error after timeout seconds."""
+    start = time.monotonic()
+    while True:
+        if check():
+            print(f"{description} is ready ({time.monotonic() - start:.1f}s)")
+            return
+        if time.monotonic() - start > timeout:
+            print(f"Timed out after {timeout:.0f}s waiting for {description}")
+            sys.exit(1)
+        time.sleep(interval)
+
+def wait_for_supabase(environment=None, timeout=180):
+    """Wait until Postgres, PostgREST and Kong are ready to serve dependents."""
+    print("Waiting for Supabase to become ready...")
+    deadline = time.monotonic() + timeout
+    remaining = lambda: max(deadline - time.monotonic(), 0)
+
+    wait_for("supabase-db container", lambda: container_status("supabase-db") == "healthy", remaining())
+    wait_for("Postgres", postgres_ready, remaining())
+    if environment == "public":
+        # Kong has no published port in the public environment, rely on container state
+        wait_for("PostgREST", lambda: container_ready("supabase-rest"), remaining())
+        wait_for("Kong", lambda: container_ready("supabase-kong"), remaining())
+    else:
+        kong_port = read_env_value("KONG_HTTP_PORT", "8000")
+        wait_for("Kong/PostgREST", lambda: http_ready(f"http://localhost:{kong_port}/rest/v1/"), remaining())
 
 def generate_searxng_secret_key():
     """Generate a secret key for SearXNG based on the current platform."""
@@ -168,7 +287,7 @@ def check_and_fix_docker_compose_for_searxng():
         try:
             # Check if the SearXNG container is running
             container_check = subprocess.run(
-                ["docker", "ps", "--filter", "name=searxng", "--format", "{{.Names}}"],
+                [DOCKER, "ps", "--filter", "name=searxng", "--format", "{{.Names}}"],
                 capture_output=True, text=True, check=True
             )
             searxng_containers = container_check.stdout.strip().split('\n')
@@ -180,7 +299,7 @@ def check_and_fix_docker_compose_for_searxng():
                 
                 # Check if uwsgi.ini exists inside the container
                 container_check = subprocess.run(
-                    ["docker", "exec", container_name, "sh", "-c", "[ -f /etc/searxng/uwsgi.ini ] && echo 'found' || echo 'not_found'"],
+                    [DOCKER, "exec", container_name, "sh", "-c", "[ -f /etc/searxng/uwsgi.ini ] && echo 'found' || echo 'not_found'"],
                     capture_output=True, text=True, check=False
                 )
                 
@@ -223,26 +342,42 @@ def main():
                       help='Profile to use for Docker Compose (default: cpu)')
     parser.add_argument('--environment', choices=['private', 'public'], default='private',
                       help='Environment to use for Docker Compose (default: private)')
+    parser.add_argument('--supabase-timeout', type=float, default=180,
+                      help='Seconds to wait for Supabase to become ready (default: 180)')
+    parser.add_argument('--skip-pull', action='store_true',
+                      help='Do not pull images before starting the services')
     args = parser.parse_args()
 
-    clone_supabase_repo()
-    prepare_supabase_env()
-    
-    # Generate SearXNG secret key and check docker-compose.yml
-    generate_searxng_secret_key()
-    check_and_fix_docker_compose_for_searxng()
-    
-    stop_existing_containers(args.profile)
-    
+    # Reads docker ps and edits docker-compose.yml, so it runs before the pulls read that file
+    with phase("SearXNG compose check"):
+        check_and_fix_docker_compose_for_searxng()
+
+    def prepare_supabase():
+        clone_supabase_repo()
+        prepare_supabase_env()
+        # The local AI compose file includes the Supabase one, which only exists after the clone
+        if not args.skip_pull:
+            pull_images(args.profile, args.environment)
+
+    with phase("Prepare (parallel)"):
+        run_parallel(prepare_supabase, generate_searxng_secret_key)
+
+    with phase("Stop existing containers"):
+        stop_existing_containers(args.profile)
+
     # Start Supabase first
-    start_supabase(args.environment)
-    
-    # Give Supabase some time to initialize
-    print("Waiting for Supabase to initialize...")
-    time.sleep(10)
-    
+    with phase("Start Supabase"):
+        start_supabase(args.environment)
+
+    # Wait for real readiness instead of a fixed sleep
+    with phase("Wait for Supabase"):
+        wait_for_supabase(args.environment, args.supabase_timeout)
+
     # Then start the local AI services
-    start_local_ai(args.profile, args.environment)
+    with phase("Start local AI"):
+        start_local_ai(args.profile, args.environment)
+
+    print_timings()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,159 @@
+"""
+Tests for start_services.py that run without Docker.
+
+DOCKER_BIN points at a stub script: `docker inspect` reports "starting" for the
+first STUB_STARTING calls and "healthy" afterwards, and `docker exec` (pg_isready)
+succeeds once the container is healthy. The private environment's Kong probe is
+answered by a local HTTP server.
+
+Run with: python -m pytest service_stack/test_start_services.py
+"""
+
+import http.server
+import importlib
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import start_services  # noqa: E402
+
+STUB_SCRIPT = """#!/bin/sh
+count_file="$STUB_STATE/inspect_count"
+count=$(cat "$count_file" 2>/dev/null || echo 0)
+case "$1" in
+  inspect)
+    echo $((count + 1)) > "$count_file"
+    if [ "$count" -lt "$STUB_STARTING" ]; then echo starting; else echo healthy; fi
+    ;;
+  exec)
+    [ "$count" -gt "$STUB_STARTING" ]
+    ;;
+  *)
+    exit 1
+    ;;
+esac
+"""
+
+real_sleep = time.sleep
+stub_dir = None
+env_patcher = None
+
+
+def setUpModule():
+    global stub_dir, env_patcher
+    stub_dir = tempfile.mkdtemp(prefix="docker-stub-")
+    stub_docker = os.path.join(stub_dir, "docker")
+    with open(stub_docker, "w") as f:
+        f.write(STUB_SCRIPT)
+    os.chmod(stub_docker, os.stat(stub_docker).st_mode | stat.S_IEXEC)
+    # DOCKER_BIN được đọc lúc import nên module được load lại
+    env_patcher = mock.patch.dict(os.environ, {"DOCKER_BIN": stub_docker})
+    env_patcher.start()
+    importlib.reload(start_services)
+
+
+def tearDownModule():
+    env_patcher.stop()
+    importlib.reload(start_services)
+    shutil.rmtree(stub_dir, ignore_errors=True)
+
+
+class KongStub(http.server.BaseHTTPRequestHandler):
+    """Answers 502 (gateway up, PostgREST not yet) for the first `failures` requests, then 401."""
+
+    failures = 0
+    requests = 0
+
+    def do_GET(self):
+        type(self).requests += 1
+        self.send_response(502 if self.requests <= self.failures else 401)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@unittest.skipIf(os.name == "nt", "the docker stub is a POSIX shell script")
+class WaitForSupabaseTest(unittest.TestCase):
+    def setUp(self):
+        state = tempfile.TemporaryDirectory(prefix="docker-stub-state-")
+        self.addCleanup(state.cleanup)
+        self.state = state.name
+        # Poll nhanh thay vì mỗi giây
+        patcher = mock.patch.object(start_services.time, "sleep", lambda seconds: real_sleep(0.01))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def stub(self, starting, **env):
+        return mock.patch.dict(os.environ, {"STUB_STATE": self.state, "STUB_STARTING": str(starting), **env})
+
+    def inspect_calls(self):
+        with open(os.path.join(self.state, "inspect_count")) as f:
+            return int(f.read())
+
+    def start_kong(self, failures):
+        handler = type("Kong", (KongStub,), {"failures": failures, "requests": 0})
+        server = http.server.HTTPServer(("localhost", 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server, handler
+
+    def test_polls_until_ready(self):
+        with self.stub(starting=3):
+            start_services.wait_for_supabase("public", timeout=10)
+        # 3 lần "starting", 1 lần "healthy" cho supabase-db, rồi rest và kong
+        self.assertEqual(self.inspect_calls(), 6)
+
+    def test_private_polls_kong(self):
+        server, kong = self.start_kong(failures=2)
+        with self.stub(starting=1, KONG_HTTP_PORT=str(server.server_port)):
+            start_services.wait_for_supabase("private", timeout=10)
+        self.assertEqual(self.inspect_calls(), 2)
+        # Hai lần 502 rồi 401 (Kong đã route tới PostgREST)
+        self.assertEqual(kong.requests, 3)
+
+    def test_private_exits_when_kong_never_ready(self):
+        server, kong = self.start_kong(failures=10**6)
+        with self.stub(starting=0, KONG_HTTP_PORT=str(server.server_port)):
+            with self.assertRaises(SystemExit) as raised:
+                start_services.wait_for_supabase("private", timeout=0.3)
+        self.assertEqual(raised.exception.code, 1)
+        self.assertGreater(kong.requests, 1)
+
+    def test_exits_after_timeout(self):
+        with self.stub(starting=10**6):
+            started = time.monotonic()
+            with self.assertRaises(SystemExit) as raised:
+                start_services.wait_for_supabase("public", timeout=0.3)
+        self.assertEqual(raised.exception.code, 1)
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertGreater(self.inspect_calls(), 1)
+
+
+class RunParallelTest(unittest.TestCase):
+    def test_reraises_failed_step(self):
+        finished = []
+
+        def ok():
+            real_sleep(0.05)
+            finished.append("ok")
+
+        def fail():
+            raise RuntimeError("pull failed")
+
+        with self.assertRaisesRegex(RuntimeError, "pull failed"):
+            start_services.run_parallel(fail, ok)
+        # Các bước khác vẫn chạy xong trước khi lỗi được ném lại
+        self.assertEqual(finished, ["ok"])
+
+
+if __name__ == "__main__":
+    unittest.main()
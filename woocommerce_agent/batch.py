@@ -0,0 +1,134 @@
+"""
+Batch runs of chat requests (regression replays, pre-generated FAQ answers).
+
+Inputs are embedded in shared batches, tool results are cached across the whole
+batch, at most `concurrency` requests run at once, and one JSON record per
+request is yielded as soon as it finishes.
+
+Served by POST /invoke-python-agent/batch (see main.py), or from the command line:
+
+    python batch.py questions.jsonl --concurrency 8 > answers.ndjson
+
+where each input line is {"chatInput": "...", "sessionId": "..."} (sessionId is optional).
+Runs are stateless unless --stateful is given, like the endpoint.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import sys
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from budget import use_tool_cache
+
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "16"))
+BATCH_EMBED_SIZE = int(os.getenv("BATCH_EMBED_SIZE", "64"))
+
+
+def _ms(seconds: float) -> int:
+    return round(seconds * 1000)
+
+
+async def run_batch(
+    requests: List[Any],
+    run_item: Callable[[Any, Optional[List[float]]], Awaitable[Any]],
+    embed_documents: Callable[[List[str]], List[List[float]]],
+    concurrency: int = 4,
+    embed_batch_size: int = BATCH_EMBED_SIZE,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Run run_item(request, embedding) for every request and yield one record per
+    request, in completion order. Records carry the request index, the output,
+    the path taken, the tool-call count and per-stage timings in milliseconds.
+    """
+    concurrency = max(1, min(concurrency, BATCH_MAX_CONCURRENCY))
+    semaphore = asyncio.Semaphore(concurrency)
+    results: asyncio.Queue = asyncio.Queue()
+
+    async def run_one(index: int, request, embedding, embed_ms: int):
+        queued = time.monotonic()
+        async with semaphore:
+            started = time.monotonic()
+            record = {"index": index, "sessionId": request.sessionId}
+            try:
+                result = await run_item(request, embedding)
+                record.update(output=result.output, path=result.path, tool_calls=result.tool_calls)
+            except Exception as e:
+                record.update(error=f"{type(e).__name__}: {e}")
+            record["timings"] = {
+                "embed_batch_ms": embed_ms,
+                "queue_ms": _ms(started - queued),
+                "run_ms": _ms(time.monotonic() - started),
+            }
+        await results.put(record)
+
+    async def schedule():
+        # Các request của batch dùng chung cache kết quả tool (task con copy context này)
+        use_tool_cache({})
+        tasks = []
+        try:
+            for offset in range(0, len(requests), embed_batch_size):
+                chunk = requests[offset:offset + embed_batch_size]
+                started = time.monotonic()
+                try:
+                    vectors = await asyncio.to_thread(embed_documents, [r.chatInput for r in chunk])
+                except Exception as e:
+                    print(f"[BATCH] Embedding batch failed, items embed on their own: {e}")
+                    vectors = [None] * len(chunk)
+                embed_ms = _ms(time.monotonic() - started)
+                # Chunk sau được embed trong lúc các request của chunk trước đang chạy
+                tasks += [
+                    asyncio.create_task(run_one(offset + i, request, vector, embed_ms))
+                    for i, (request, vector) in enumerate(zip(chunk, vectors))
+                ]
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await results.put(None)
+
+    producer = asyncio.create_task(schedule())
+    try:
+        while (record := await results.get()) is not None:
+            yield record
+    finally:
+        # Client ngắt kết nối: hủy các request chưa xong
+        producer.cancel()
+
+
+async def _run_cli(args):
+    with open(args.input, encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    out = sys.stdout
+    started = time.monotonic()
+    # Log của agent (print) sang stderr để stdout chỉ chứa NDJSON
+    with contextlib.redirect_stdout(sys.stderr):
+        import main as agent
+
+        requests = [
+            agent.ChatRequest(chatInput=row["chatInput"], sessionId=row.get("sessionId") or f"batch-{i}")
+            for i, row in enumerate(rows)
+        ]
+        async with agent.lifespan(agent.app):
+            async for record in agent.run_chat_batch(requests, stateless=not args.stateful, concurrency=args.concurrency):
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+        print(f"[BATCH] {len(requests)} requests in {time.monotonic() - started:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a JSONL file of chat requests through the agent.")
+    parser.add_argument("input", help="JSONL file with one {\"chatInput\", \"sessionId\"} object per line")
+    parser.add_argument(
+        "--stateful", action="store_true",
+        help="Read session history and store the messages in chat_histories (default: stateless)",
+    )
+    parser.add_argument("--concurrency", type=int, default=4)
+    asyncio.run(_run_cli(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""
+Per-request latency budget for the ReAct loop.
+
+- AGENT_DEADLINE_SECONDS: end-to-end deadline of one request (history read,
+  routing, cascade and agent loop; see bounded())
+- AGENT_MAX_TOOL_CALLS: tool calls allowed per request, small and large model
+  together; further calls return an error message asking the model to answer
+  with what it has
+- AGENT_TOOL_TIMEOUT_SECONDS: timeout of a single tool call
+- AGENT_RECURSION_LIMIT: LangGraph recursion limit (each model or tool step counts)
+
+When the deadline or the recursion limit is hit, the loop is stopped and a
+best-effort answer is written from the tool results gathered so far (one LLM
+call without tools, bounded by AGENT_FALLBACK_TIMEOUT_SECONDS).
+
+Batch runs can also share tool results between requests (see use_tool_cache).
+"""
+
+import asyncio
+import json
+import os
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import List, Optional
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.tools import BaseTool, StructuredTool
+from langgraph.errors import GraphRecursionError
+
+from prompts import system_prompt
+
+FALLBACK_MESSAGE = (
+    "Xin lỗi anh/chị, hệ thống đang bận nên em chưa tra cứu kịp. "
+    "Anh/chị vui lòng thử lại sau ít phút hoặc hỏi cụ thể hơn giúp em ạ."
+)
+
+
+@dataclass
+class BudgetState:
+    deadline: float
+    tool_calls: int = 0
+
+    def remaining(self) -> float:
+        return max(self.deadline - time.monotonic(), 0.0)
+
+
+# Budget của request hiện tại; tool chạy trong task con nên vẫn thấy cùng state
+_current: ContextVar[Optional[BudgetState]] = ContextVar("agent_budget", default=None)
+# Cache kết quả tool dùng chung cho các request của một batch
+_tool_cache: ContextVar[Optional[dict]] = ContextVar("tool_cache", default=None)
+
+
+def use_tool_cache(cache: dict):
+    """Share tool results between the requests started from the current context."""
+    _tool_cache.set(cache)
+
+
+class AgentBudget:
+    def __init__(
+        self,
+        deadline: float = 60.0,
+        max_tool_calls: int = 6,
+        tool_timeout: float = 20.0,
+        recursion_limit: int = 15,
+        fallback_timeout: float = 15.0,
+    ):
+        self.deadline = deadline
+        self.max_tool_calls = max_tool_calls
+        self.tool_timeout = tool_timeout
+        self.recursion_limit = recursion_limit
+        self.fallback_timeout = fallback_timeout
+
+    @classmethod
+    def from_env(cls) -> "AgentBudget":
+        return cls(
+            deadline=float(os.getenv("AGENT_DEADLINE_SECONDS", "60")),
+            max_tool_calls=int(os.getenv("AGENT_MAX_TOOL_CALLS", "6")),
+            tool_timeout=float(os.getenv("AGENT_TOOL_TIMEOUT_SECONDS", "20")),
+            recursion_limit=int(os.getenv("AGENT_RECURSION_LIMIT", "15")),
+            fallback_timeout=float(os.getenv("AGENT_FALLBACK_TIMEOUT_SECONDS", "15")),
+        )
+
+    def start(self) -> BudgetState:
+        """Start the budget of the current request."""
+        state = BudgetState(deadline=time.monotonic() + self.deadline)
+        _current.set(state)
+        return state
+
+    def remaining(self) -> float:
+        state = _current.get()
+        return state.remaining() if state is not None else self.deadline
+
+    async def bounded(self, awaitable, default=None, stage: str = ""):
+        """Await within the remaining budget; on timeout return `default`."""
+        try:
+            return await asyncio.wait_for(awaitable, timeout=self.remaining())
+        except asyncio.TimeoutError:
+            print(f"[BUDGET] deadline hit during {stage or 'request'}")
+            return default
+
+    async def call_tool(self, tool: BaseTool, args: dict):
+        state = _current.get()
+        if state is None:
+            return await tool.ainvoke(args)
+        state.tool_calls += 1
+        if state.tool_calls > self.max_tool_calls:
+            return f"Error: tool call limit ({self.max_tool_calls}) reached. Answer with the results gathered so far."
+        timeout = min(self.tool_timeout, state.remaining())
+        if timeout <= 0:
+            return "Error: time budget exhausted. Answer with the results gathered so far."
+        cache = _tool_cache.get()
+        if cache is None:
+            return await self._call_with_timeout(tool, args, timeout)
+
+        key = (tool.name, json.dumps(args, sort_keys=True, ensure_ascii=False, default=str))
+        if key not in cache:
+            cache[key] = asyncio.ensure_future(self._call_with_timeout(tool, args, timeout))
+        try:
+            result = await asyncio.shield(cache[key])
+        except Exception:
+            cache.pop(key, None)
+            raise
+        if isinstance(result, str) and result.startswith("Error"):
+            # Không giữ lỗi/timeout trong cache, lần gọi sau được thử lại
+            cache.pop(key, None)
+        return result
+
+    async def _call_with_timeout(self, tool: BaseTool, args: dict, timeout: float):
+        try:
+            # Tool sync chạy trong thread: timeout trả lời ngay cho model, thread tự kết thúc sau
+            return await asyncio.wait_for(tool.ainvoke(args), timeout=timeout)
+        except asyncio.TimeoutError:
+            print(f"[BUDGET] {tool.name} timed out after {timeout:.1f}s")
+            return f"Error: {tool.name} timed out after {timeout:.0f}s."
+
+    def wrap_tool(self, tool) -> BaseTool:
+        """Same name, description and arguments; calls go through call_tool."""
+        if not isinstance(tool, BaseTool):
+            tool = StructuredTool.from_function(tool)
+
+        async def guarded(**kwargs):
+            return await self.call_tool(tool, kwargs)
+
+        return StructuredTool.from_function(
+            coroutine=guarded,
+            name=tool.name,
+            description=tool.description,
+            args_schema=tool.args_schema,
+        )
+
+    def wrap_tools(self, tools: list) -> List[BaseTool]:
+        return [self.wrap_tool(tool) for tool in tools]
+
+    async def run(self, graph, messages: List[BaseMessage], config: Optional[dict], llm) -> List[BaseMessage]:
+        """
+        Run the graph within the remaining budget and return the final message list.
+
+        If the budget runs out, the partial turn is closed with a best-effort answer
+        (and written into the checkpointer state when config is set).
+        """
+        state = _current.get() or self.start()
+        run_config = {**(config or {}), "recursion_limit": self.recursion_limit}
+        latest = {"messages": list(messages)}
+
+        async def consume():
+            async for values in graph.astream({"messages": messages}, config=run_config, stream_mode="values"):
+                latest["messages"] = values["messages"]
+
+        try:
+            await asyncio.wait_for(consume(), timeout=state.remaining())
+            return latest["messages"]
+        except asyncio.TimeoutError:
+            reason = "deadline"
+        except GraphRecursionError:
+            reason = "recursion_limit"
+
+        partial = latest["messages"]
+        # Lượt hiện tại bắt đầu từ HumanMessage cuối cùng (ReAct không thêm HumanMessage)
+        start = max((i for i, m in enumerate(partial) if isinstance(m, HumanMessage)), default=0)
+        turn = partial[start:]
+        answered = {m.tool_call_id for m in turn if isinstance(m, ToolMessage)}
+        dangling = [
+            call for m in turn if isinstance(m, AIMessage)
+            for call in m.tool_calls if call["id"] not in answered
+        ]
+        results = [
+            m for m in turn
+            if isinstance(m, ToolMessage) and not str(m.content).startswith("Error")
+        ]
+        print(f"[BUDGET] {reason} after {state.tool_calls} tool calls, answering from {len(results)} results")
+
+        answer = await self.best_effort_answer(llm, partial[:start], turn[0] if turn else None, results)
+        # Đóng các tool call dở dang để state vẫn hợp lệ cho lượt sau
+        patch = [
+            ToolMessage(content="Error: cancelled, time budget exhausted.", tool_call_id=call["id"], name=call["name"])
+            for call in dangling
+        ] + [AIMessage(content=answer)]
+        if config is not None:
+            await graph.aupdate_state(config, {"messages": patch})
+        return partial + patch
+
+    async def best_effort_answer(self, llm, history: List[BaseMessage], question: Optional[BaseMessage],
+                                 results: List[ToolMessage]) -> str:
+        if question is None:
+            return FALLBACK_MESSAGE
+        gathered = "\n\n".join(f"KẾT QUẢ TỪ {m.name}:\n{m.content}" for m in results) \
+            or "Chưa có kết quả nào từ tool."
+        conversation = [
+            m for m in history
+            if isinstance(m, (HumanMessage, AIMessage)) and isinstance(m.content, str) and m.content
+        ]
+        prompt_messages = [
+            SystemMessage(content=system_prompt),
+            *conversation,
+            HumanMessage(content=(
+                f"{question.content}\n\n{gathered}\n\n"
+                "Đã hết thời gian tra cứu. Trả lời khách hàng dựa trên các kết quả trên; "
+                "nếu chưa đủ thông tin thì nói rõ và đề nghị khách hỏi cụ thể hơn."
+            )),
+        ]
+        try:
+            response = await asyncio.wait_for(llm.ainvoke(prompt_messages), timeout=self.fallback_timeout)
+            return response.content
+        except Exception as e:
+            print(f"[BUDGET] Best-effort answer failed: {e}")
+            return FALLBACK_MESSAGE
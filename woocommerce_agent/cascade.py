@@ -0,0 +1,115 @@
+"""
+Model cascade: serve each turn with a small, fast model first and escalate to
+the large model only when the small one struggles.
+
+Escalation triggers (see should_escalate):
+- malformed tool calls
+- tool errors (e.g. broken SQL in query_supabase)
+- too many tool-calling iterations
+- low self-reported confidence (<confidence>0.0-1.0</confidence> at the end of the answer)
+
+Every decision is printed as one JSON line ("[CASCADE] {...}") for tuning.
+"""
+
+import asyncio
+import json
+import os
+import re
+import time
+from typing import List, Optional, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
+from langgraph.errors import GraphRecursionError
+
+_CONFIDENCE_RE = re.compile(r"\s*<confidence>\s*([0-9]*\.?[0-9]+)\s*</confidence>\s*", re.IGNORECASE)
+
+# Chuỗi lỗi mà các tool trả về thay vì raise
+TOOL_ERROR_PREFIXES = ("Lỗi truy vấn", "Error:", "Failed to fetch")
+
+
+def split_confidence(content: str) -> Tuple[str, Optional[float]]:
+    """Remove the confidence tag from an answer and return (answer, confidence)."""
+    match = _CONFIDENCE_RE.search(content)
+    if not match:
+        return content, None
+    return _CONFIDENCE_RE.sub(" ", content).strip(), float(match.group(1))
+
+
+class ModelCascade:
+    def __init__(self, max_tool_calls: int = 3, min_confidence: float = 0.6, recursion_limit: int = 12):
+        self.max_tool_calls = max_tool_calls
+        self.min_confidence = min_confidence
+        self.recursion_limit = recursion_limit
+
+    @classmethod
+    def from_env(cls) -> Optional["ModelCascade"]:
+        """Cascade is enabled when LLM_SMALL_CHOICE names the small model."""
+        if not os.getenv("LLM_SMALL_CHOICE"):
+            return None
+        return cls(
+            max_tool_calls=int(os.getenv("CASCADE_MAX_TOOL_CALLS", "3")),
+            min_confidence=float(os.getenv("CASCADE_MIN_CONFIDENCE", "0.6")),
+            recursion_limit=int(os.getenv("CASCADE_RECURSION_LIMIT", "12")),
+        )
+
+    def should_escalate(self, new_messages: List[BaseMessage]) -> Tuple[Optional[str], Optional[float]]:
+        """Return (reason, confidence); reason is None when the small model's answer is kept."""
+        tool_calls = 0
+        for message in new_messages:
+            if isinstance(message, AIMessage):
+                if message.invalid_tool_calls:
+                    return "malformed_tool_call", None
+                tool_calls += len(message.tool_calls)
+            elif isinstance(message, ToolMessage):
+                content = message.content if isinstance(message.content, str) else str(message.content)
+                if message.status == "error" or content.startswith(TOOL_ERROR_PREFIXES):
+                    return "tool_error", None
+        if tool_calls > self.max_tool_calls:
+            return "too_many_iterations", None
+
+        final = new_messages[-1] if new_messages else None
+        if not isinstance(final, AIMessage) or final.tool_calls or not final.content:
+            return "no_final_answer", None
+        _, confidence = split_confidence(final.content)
+        if confidence is not None and confidence < self.min_confidence:
+            return "low_confidence", confidence
+        return None, confidence
+
+    async def run(self, small_graph, messages: List[BaseMessage], session_id: str,
+                  timeout: Optional[float] = None) -> Optional[List[BaseMessage]]:
+        """
+        Run the turn on the small model, giving up after `timeout` seconds.
+
+        Returns the full message list (confidence tag stripped from the answer),
+        or None if the turn should be escalated to the large model.
+        """
+        started = time.monotonic()
+        reason, confidence, new_messages = None, None, []
+        try:
+            result = await asyncio.wait_for(
+                small_graph.ainvoke({"messages": messages}, config={"recursion_limit": self.recursion_limit}),
+                timeout=timeout,
+            )
+            new_messages = result["messages"][len(messages):]
+            reason, confidence = self.should_escalate(new_messages)
+        except GraphRecursionError:
+            reason = "recursion_limit"
+        except asyncio.TimeoutError:
+            reason = "timeout"
+        except Exception as e:
+            reason = f"error: {type(e).__name__}"
+
+        print("[CASCADE] " + json.dumps({
+            "session_id": session_id,
+            "escalated": reason is not None,
+            "reason": reason,
+            "confidence": confidence,
+            "tool_calls": sum(len(m.tool_calls) for m in new_messages if isinstance(m, AIMessage)),
+            "small_model_ms": round((time.monotonic() - started) * 1000),
+        }))
+        if reason is not None:
+            return None
+
+        answer, _ = split_confidence(result["messages"][-1].content)
+        final = result["messages"][-1].model_copy(update={"content": answer})
+        return result["messages"][:-1] + [final]
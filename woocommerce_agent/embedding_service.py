@@ -0,0 +1,236 @@
+"""
+Embedding sidecar for the agent.
+
+One process owns the gte model and serves embedding batches over a local Unix
+socket, so uvicorn workers do not each load their own copy of torch + model.
+
+Run the sidecar:
+    EMBEDDING_SOCKET=/tmp/embedding.sock python embedding_service.py
+
+Then start the workers with the same EMBEDDING_SOCKET and they will use
+RemoteEmbeddings instead of loading the model locally.
+"""
+
+import json
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+from array import array
+from typing import List, Optional
+
+from dotenv import load_dotenv
+from langchain_core.embeddings import Embeddings
+
+load_dotenv()
+
+EMBEDDING_MODEL_NAME = "Alibaba-NLP/gte-multilingual-base"
+
+_HEADER = struct.Struct("!I")
+
+
+def load_embedding_model(device: Optional[str] = None):
+    """Load the gte embedding model in the current process."""
+    # Import nặng chỉ khi thật sự load model (worker ở chế độ sidecar không cần torch)
+    import torch
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+
+    if device is None:
+        device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    return HuggingFaceEmbeddings(
+        model_name=EMBEDDING_MODEL_NAME,
+        model_kwargs={'device': device, 'trust_remote_code': True}
+    )
+
+
+def get_embedding_model():
+    """
+    Return the embedding model for this process.
+
+    If EMBEDDING_SOCKET is set, the model lives in the sidecar and a thin
+    RemoteEmbeddings client is returned; otherwise the model is loaded locally.
+    """
+    socket_path = os.getenv("EMBEDDING_SOCKET")
+    if socket_path:
+        return RemoteEmbeddings(socket_path)
+    return load_embedding_model()
+
+
+# Wire protocol: every frame is a 4-byte big-endian length followed by the payload.
+# Request:  JSON {"texts": [...]}
+# Response: JSON {"n": int, "dim": int} followed by one frame of float32 values,
+#           or JSON {"error": str}.
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < size:
+        chunk = sock.recv(size - len(buf))
+        if not chunk:
+            raise ConnectionError("Embedding socket closed")
+        buf.extend(chunk)
+    return bytes(buf)
+
+
+def _send_frame(sock: socket.socket, payload: bytes):
+    sock.sendall(_HEADER.pack(len(payload)) + payload)
+
+
+def _recv_frame(sock: socket.socket) -> bytes:
+    (size,) = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    return _recv_exact(sock, size)
+
+
+class RemoteEmbeddings(Embeddings):
+    """LangChain Embeddings client that forwards batches to the embedding sidecar."""
+
+    def __init__(self, socket_path: str, timeout: float = 30.0):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        # Mỗi thread giữ một kết nối riêng (tool sync chạy trong thread pool)
+        self._local = threading.local()
+
+    def _connect(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self._local.sock = sock
+        return sock
+
+    def _close(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is not None:
+            try:
+                sock.close()
+            finally:
+                self._local.sock = None
+
+    def _request(self, texts: List[str]) -> List[List[float]]:
+        sock = getattr(self._local, "sock", None) or self._connect()
+        _send_frame(sock, json.dumps({"texts": texts}).encode("utf-8"))
+        header = json.loads(_recv_frame(sock))
+        if "error" in header:
+            raise RuntimeError(f"Embedding sidecar error: {header['error']}")
+        values = array("f")
+        values.frombytes(_recv_frame(sock))
+        dim = header["dim"]
+        return [values[i * dim:(i + 1) * dim].tolist() for i in range(header["n"])]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        try:
+            return self._request(list(texts))
+        except (ConnectionError, OSError):
+            # Sidecar có thể đã restart: kết nối lại một lần
+            self._close()
+            return self._request(list(texts))
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+class _Job:
+    __slots__ = ("texts", "done", "result", "error")
+
+    def __init__(self, texts: List[str]):
+        self.texts = texts
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class EmbeddingBatcher:
+    """
+    Gom các request đến trong một cửa sổ ngắn thành một batch để gọi model một lần.
+    """
+
+    def __init__(self, model, max_batch: int = 64, max_wait: float = 0.005):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue: "queue.Queue[_Job]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, texts: List[str]) -> List[List[float]]:
+        job = _Job(texts)
+        self._queue.put(job)
+        job.done.wait()
+        if job.error is not None:
+            raise job.error
+        return job.result
+
+    def _run(self):
+        while True:
+            jobs = [self._queue.get()]
+            size = len(jobs[0].texts)
+            while size < self.max_batch:
+                try:
+                    job = self._queue.get(timeout=self.max_wait)
+                except queue.Empty:
+                    break
+                jobs.append(job)
+                size += len(job.texts)
+
+            texts = [t for job in jobs for t in job.texts]
+            try:
+                vectors = self.model.embed_documents(texts)
+                offset = 0
+                for job in jobs:
+                    job.result = vectors[offset:offset + len(job.texts)]
+                    offset += len(job.texts)
+            except Exception as e:
+                for job in jobs:
+                    job.error = e
+            for job in jobs:
+                job.done.set()
+
+
+class _EmbeddingHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        sock = self.request
+        while True:
+            try:
+                request = json.loads(_recv_frame(sock))
+            except ConnectionError:
+                return
+            try:
+                vectors = self.server.batcher.submit(request["texts"])
+            except Exception as e:
+                _send_frame(sock, json.dumps({"error": str(e)}).encode("utf-8"))
+                continue
+            dim = len(vectors[0]) if vectors else 0
+            values = array("f", (v for vec in vectors for v in vec))
+            _send_frame(sock, json.dumps({"n": len(vectors), "dim": dim}).encode("utf-8"))
+            _send_frame(sock, values.tobytes())
+
+
+class EmbeddingServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, batcher: EmbeddingBatcher):
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        self.batcher = batcher
+        super().__init__(socket_path, _EmbeddingHandler)
+
+
+def serve(socket_path: str):
+    model = load_embedding_model()
+    batcher = EmbeddingBatcher(
+        model,
+        max_batch=int(os.getenv("EMBEDDING_MAX_BATCH", "64")),
+        max_wait=float(os.getenv("EMBEDDING_MAX_WAIT_MS", "5")) / 1000,
+    )
+    with EmbeddingServer(socket_path, batcher) as server:
+        print(f"[EMBEDDING] Serving {EMBEDDING_MODEL_NAME} on {socket_path}")
+        try:
+            server.serve_forever()
+        finally:
+            os.unlink(socket_path)
+
+
+if __name__ == "__main__":
+    serve(os.getenv("EMBEDDING_SOCKET", "/tmp/embedding.sock"))
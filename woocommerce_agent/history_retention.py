@@ -0,0 +1,42 @@
+"""
+Retention job for chat_histories.
+
+Moves sessions with no new message for --inactive-days into chat_histories_archive,
+in batches, using the archive_chat_sessions function from messages.sql.
+Run it periodically (cron, scheduled container, ...).
+"""
+import argparse
+import os
+import time
+
+from dotenv import load_dotenv
+from supabase import create_client
+
+
+def archive_old_sessions(client, inactive_days: int, batch_size: int, pause: float = 0.5) -> int:
+    """Archive stale sessions batch by batch; return the number of messages moved."""
+    total = 0
+    while True:
+        response = client.rpc("archive_chat_sessions", {
+            "inactive_for": f"{inactive_days} days",
+            "batch_size": batch_size,
+        }).execute()
+        moved = response.data or 0
+        if not moved:
+            return total
+        total += moved
+        print(f"[RETENTION] Archived {moved} messages (total {total})")
+        # Nghỉ giữa các batch để không chiếm database quá lâu
+        time.sleep(pause)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive inactive chat sessions.")
+    parser.add_argument("--inactive-days", type=int, default=90)
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    load_dotenv()
+    client = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_SERVICE_KEY"))
+    total = archive_old_sessions(client, args.inactive_days, args.batch_size)
+    print(f"[SUCCESS] Đã lưu trữ {total} tin nhắn")
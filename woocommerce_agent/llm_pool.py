@@ -0,0 +1,252 @@
+"""
+Pool of OpenAI-compatible LLM backends (e.g. several Ollama hosts).
+
+- least-outstanding-requests balancing
+- background health checks on GET {base_url}/models
+- a circuit breaker per backend, counting only backend failures (5xx, connection
+  errors, timeouts); client errors (4xx) are raised without failover
+- optional hedged requests: after LLM_HEDGE_AFTER_SECONDS without a reply, send
+  the same request to another backend and keep whichever answers first
+
+PooledChatModel is a LangChain chat model, so it works with create_react_agent.
+"""
+
+import asyncio
+import json
+import os
+import random
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+import httpx
+import openai
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from langchain_openai import ChatOpenAI
+
+
+def is_backend_error(error: BaseException) -> bool:
+    """True for errors caused by the backend itself, where another backend may succeed."""
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code >= 500
+    # APITimeoutError là lớp con của APIConnectionError
+    return isinstance(error, (openai.APIConnectionError, httpx.TransportError, asyncio.TimeoutError, TimeoutError))
+
+
+class Backend:
+    def __init__(self, base_url: str, api_key: str):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.in_flight = 0
+        self.failures = 0
+        self.opened_until = 0.0
+        self.healthy = True
+        self._models: Dict[str, ChatOpenAI] = {}
+
+    def __repr__(self):
+        return f"Backend({self.base_url})"
+
+    def client_for(self, model: str) -> ChatOpenAI:
+        if model not in self._models:
+            # Không retry trong client: pool tự failover/hedge và đếm từng lỗi cho circuit breaker
+            self._models[model] = ChatOpenAI(
+                model=model, base_url=self.base_url, api_key=self.api_key, max_retries=0
+            )
+        return self._models[model]
+
+    def available(self, now: float) -> bool:
+        return self.healthy and self.opened_until <= now
+
+
+class BackendPool:
+    def __init__(
+        self,
+        backends: List[Backend],
+        failure_threshold: int = 3,
+        cooldown: float = 30.0,
+        hedge_after: Optional[float] = None,
+        health_interval: float = 15.0,
+    ):
+        self.backends = backends
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.hedge_after = hedge_after
+        self.health_interval = health_interval
+        self._health_task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_env(cls) -> Optional["BackendPool"]:
+        """
+        Build the pool from LLM_BACKENDS, either a comma-separated list of base URLs
+        (sharing LLM_API_KEY) or a JSON list of {"base_url": ..., "api_key": ...}.
+        Returns None when LLM_BACKENDS is not set.
+        """
+        raw = os.getenv("LLM_BACKENDS", "").strip()
+        if not raw:
+            return None
+        default_key = os.getenv("LLM_API_KEY", "ollama")
+        if raw.startswith("["):
+            backends = [Backend(b["base_url"], b.get("api_key", default_key)) for b in json.loads(raw)]
+        else:
+            backends = [Backend(url.strip(), default_key) for url in raw.split(",") if url.strip()]
+        hedge_after = os.getenv("LLM_HEDGE_AFTER_SECONDS")
+        return cls(
+            backends,
+            failure_threshold=int(os.getenv("LLM_CIRCUIT_FAILURES", "3")),
+            cooldown=float(os.getenv("LLM_CIRCUIT_COOLDOWN_SECONDS", "30")),
+            hedge_after=float(hedge_after) if hedge_after else None,
+            health_interval=float(os.getenv("LLM_HEALTH_INTERVAL_SECONDS", "15")),
+        )
+
+    def pick(self, exclude: Sequence[Backend] = ()) -> Optional[Backend]:
+        """Least outstanding requests among available backends; random among ties."""
+        now = time.monotonic()
+        candidates = [b for b in self.backends if b not in exclude]
+        if not candidates:
+            return None
+        available = [b for b in candidates if b.available(now)]
+        if not available:
+            # Tất cả đều lỗi: thử backend có circuit sắp đóng lại sớm nhất
+            return min(candidates, key=lambda b: b.opened_until)
+        lowest = min(b.in_flight for b in available)
+        return random.choice([b for b in available if b.in_flight == lowest])
+
+    def record_success(self, backend: Backend):
+        backend.failures = 0
+        backend.opened_until = 0.0
+
+    def record_failure(self, backend: Backend, error: Exception):
+        backend.failures += 1
+        # Khi circuit mở lại sau cooldown, chỉ cần một lỗi nữa là mở tiếp (half-open)
+        if backend.failures >= self.failure_threshold:
+            backend.opened_until = time.monotonic() + self.cooldown
+            print(f"[LLM POOL] Circuit open for {backend} ({backend.failures} failures): {error}")
+
+    def _ensure_health_checks(self):
+        if self._health_task is None or self._health_task.done():
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def stop(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            await asyncio.gather(self._health_task, return_exceptions=True)
+            self._health_task = None
+
+    async def _health_loop(self):
+        async with httpx.AsyncClient(timeout=5.0) as client:
+            while True:
+                for backend in self.backends:
+                    try:
+                        response = await client.get(
+                            f"{backend.base_url}/models",
+                            headers={"Authorization": f"Bearer {backend.api_key}"},
+                        )
+                        healthy = response.status_code < 500
+                    except httpx.HTTPError:
+                        healthy = False
+                    if healthy != backend.healthy:
+                        print(f"[LLM POOL] {backend} is {'healthy' if healthy else 'unhealthy'}")
+                    backend.healthy = healthy
+                await asyncio.sleep(self.health_interval)
+
+    async def _call(self, backend: Backend, model: str, messages, stop, **kwargs) -> ChatResult:
+        backend.in_flight += 1
+        try:
+            result = await backend.client_for(model)._agenerate(messages, stop=stop, **kwargs)
+            self.record_success(backend)
+            return result
+        except asyncio.CancelledError:
+            # Request bị hủy do hedge thua cuộc, không tính là lỗi
+            raise
+        except Exception as e:
+            # Lỗi 4xx là lỗi của request, không phải của backend
+            if is_backend_error(e):
+                self.record_failure(backend, e)
+            raise
+        finally:
+            backend.in_flight -= 1
+
+    async def agenerate(self, model: str, messages, stop=None, **kwargs) -> ChatResult:
+        self._ensure_health_checks()
+        tried = [self.pick()]
+        pending = {asyncio.create_task(self._call(tried[0], model, messages, stop, **kwargs))}
+        hedged = self.hedge_after is None or len(self.backends) < 2
+        last_error: Optional[BaseException] = None
+        try:
+            while pending:
+                timeout = None if hedged else self.hedge_after
+                done, pending = await asyncio.wait(
+                    pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    last_error = task.exception()
+                    if not is_backend_error(last_error):
+                        # Backend khác cũng sẽ từ chối request này
+                        raise last_error
+
+                backend = None
+                if not done and not hedged:
+                    # Hedge: backend đầu trả lời quá chậm
+                    hedged = True
+                    backend = self.pick(exclude=tried)
+                elif done and not pending:
+                    # Failover: mọi request đang chạy đều lỗi, thử backend chưa dùng
+                    backend = self.pick(exclude=tried)
+                if backend is not None:
+                    tried.append(backend)
+                    pending.add(asyncio.create_task(self._call(backend, model, messages, stop, **kwargs)))
+            raise last_error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def generate(self, model: str, messages, stop=None, **kwargs) -> ChatResult:
+        """Sync path: balancing and failover, without hedging."""
+        tried: List[Backend] = []
+        last_error: Optional[Exception] = None
+        while (backend := self.pick(exclude=tried)) is not None:
+            tried.append(backend)
+            backend.in_flight += 1
+            try:
+                result = backend.client_for(model)._generate(messages, stop=stop, **kwargs)
+                self.record_success(backend)
+                return result
+            except Exception as e:
+                if not is_backend_error(e):
+                    raise
+                self.record_failure(backend, e)
+                last_error = e
+            finally:
+                backend.in_flight -= 1
+        raise last_error
+
+
+class PooledChatModel(BaseChatModel):
+    """Chat model that sends each generation to a backend chosen by the pool."""
+
+    pool: Any
+    model_name: str
+
+    @property
+    def _llm_type(self) -> str:
+        return "pooled-openai"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model_name": self.model_name, "backends": [b.base_url for b in self.pool.backends]}
+
+    def bind_tools(self, tools, *, tool_choice=None, **kwargs):
+        formatted_tools = [convert_to_openai_tool(tool) for tool in tools]
+        if tool_choice is not None:
+            kwargs["tool_choice"] = tool_choice
+        return super().bind(tools=formatted_tools, **kwargs)
+
+    def _generate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        return self.pool.generate(self.model_name, messages, stop=stop, **kwargs)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        return await self.pool.agenerate(self.model_name, messages, stop=stop, **kwargs)
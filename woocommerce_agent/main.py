@@ -2,6 +2,7 @@ from typing import List, Optional, Dict, Any
 from fastapi import FastAPI, HTTPException, Security, Depends
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from contextlib import asynccontextmanager
 from supabase import create_client, Client
 from pydantic import BaseModel
@@ -11,16 +12,23 @@ from httpx import AsyncClient
 import os
 import json
 import asyncio
-from langchain_mcp_adapters.client import MultiServerMCPClient
 
 # LangGraph and LangChain imports
 from langchain_openai import ChatOpenAI
 from langgraph.prebuilt import create_react_agent
-from prompts import system_prompt
-from langchain_core.messages import HumanMessage, AIMessage
-import torch
+from prompts import system_prompt, cascade_confidence_prompt
+from langchain_core.messages import HumanMessage, AIMessage, SystemMessage, ToolMessage
 from retriever.retrieval import query_supabase, get_product_semantic
-from langchain_community.embeddings import HuggingFaceEmbeddings
+from retriever.catalog import catalog, get_catalog_facets, lookup_product
+from embedding_service import get_embedding_model
+from mcp_tools import MCPToolManager
+from session_state import SessionStateStore
+from router import IntentRouter, Route
+from llm_pool import BackendPool, PooledChatModel
+from cascade import ModelCascade
+from budget import AgentBudget
+from prefetch import PREFETCH_RETRIEVAL, QueryPrefetch, current_prefetch
+from batch import run_batch
 # Load environment variables
 load_dotenv()
 
@@ -32,10 +40,19 @@ async def lifespan(app: FastAPI):
     # Startup
     global http_client
     http_client = AsyncClient()
+    # Mở kết nối MCP một lần, giữ session cho mọi request
+    await mcp_tools.start()
+    # Checkpointer (nếu bật) cần event loop nên graph được build lại sau khi mở
+    await session_store.start()
+    rebuild_agent_graph()
 
     yield
 
     # Shutdown
+    await session_store.stop()
+    await mcp_tools.stop()
+    if llm_pool is not None:
+        await llm_pool.stop()
     await http_client.aclose()
 
 # Initialize FastAPI app with lifespan
@@ -66,6 +83,12 @@ class ChatRequest(BaseModel):
 class ChatResponse(BaseModel):
     output: str
 
+class BatchChatRequest(BaseModel):
+    requests: List[ChatRequest]
+    # Stateless: không đọc lịch sử, không lưu message (replay/đánh giá)
+    stateless: bool = True
+    concurrency: int = 4
+
 # Agent dependencies
 @dataclass
 class AgentDeps:
@@ -73,34 +96,9 @@ class AgentDeps:
     searxng_base_url: str
 
 # LangGraph agent setup
-    
-# Load MCP tools
-
-# async def get_mcp_tools():
-#     client = MultiServerMCPClient(
-#         {
-#             # "math":{
-#             #     "command":"python",
-#             #     "args":["first_server.py"], ## Ensure correct absolute path
-#             #     "transport":"stdio",
-#             # },
-#             "weather": {
-#                 "url": "http://localhost:8001/mcp",  # Ensure server is running here
-#                 "transport": "streamable_http",
-#             }
-#         }
-#     )
-
-#     tools = await client.get_tools()
-#     return tools
-
-# tools = asyncio.run(get_mcp_tools())
-
-
-embedding_model = HuggingFaceEmbeddings(
-    model_name="Alibaba-NLP/gte-multilingual-base",
-    model_kwargs={'device':'cuda' if torch.cuda.is_available() else 'cpu', 'trust_remote_code': True}
-)
+
+# Load model tại chỗ, hoặc dùng embedding sidecar nếu EMBEDDING_SOCKET được set
+embedding_model = get_embedding_model()
 
 def get_product_semantic_tool(query: str) -> str:
     """
@@ -113,23 +111,126 @@ def get_product_semantic_tool(query: str) -> str:
         str: A formatted string summarizing the total number of products found
              and their metadata details.
     """
-    return get_product_semantic(query, embedding_model=embedding_model)
+    # Dùng lại embedding / kết quả đã prefetch nếu query trùng với câu hỏi của user
+    prefetch = current_prefetch(query)
+    if prefetch is None:
+        return get_product_semantic(query, embedding_model=embedding_model)
+    if prefetch.retrieval is not None:
+        try:
+            return prefetch.retrieval.result()
+        except Exception as e:
+            print(f"[PREFETCH] Prefetched retrieval failed: {e}")
+    return get_product_semantic(query, embedding_model=embedding_model, query_embedding=prefetch.embedding)
+
+# Nhiều backend OpenAI-compatible nếu LLM_BACKENDS được set (see llm_pool.py)
+llm_pool = BackendPool.from_env()
 
 # Get model configuration for LangChain
-def get_langchain_model():
-    llm = os.getenv('LLM_CHOICE', 'gpt-4.1-mini')
+def get_langchain_model(model_name: Optional[str] = None):
+    llm = model_name or os.getenv('LLM_CHOICE', 'gpt-4.1-mini')
+    if llm_pool is not None:
+        return PooledChatModel(pool=llm_pool, model_name=llm)
     base_url = os.getenv('LLM_BASE_URL', 'http://localhost:11434/v1')
     api_key = os.getenv('LLM_API_KEY', 'ollama')
     return ChatOpenAI(model=llm, base_url=base_url, api_key=api_key)
 
 llm = get_langchain_model()
 
-# Use create_react_agent for a clean agent setup
-agent_graph = create_react_agent(
-    model=llm,
-    tools=[get_product_semantic_tool, query_supabase],
-    prompt=system_prompt
-)
+# Cascade: model nhỏ trả lời trước, chỉ chuyển sang model lớn khi cần (see cascade.py)
+cascade = ModelCascade.from_env()
+small_llm = get_langchain_model(os.getenv('LLM_SMALL_CHOICE')) if cascade is not None else None
+
+# Deadline, số tool call và timeout mỗi tool cho từng request (see budget.py)
+budget = AgentBudget.from_env()
+
+def get_agent_tools():
+    """Local tools plus the currently available MCP tools, each bounded by the request budget."""
+    return budget.wrap_tools(
+        [get_product_semantic_tool, query_supabase, get_catalog_facets, lookup_product, *mcp_tools.get_tools()]
+    )
+
+def build_agent_graph(checkpointer=None):
+    """Build the ReAct agent with the local tools plus the currently available MCP tools."""
+    # Use create_react_agent for a clean agent setup
+    return create_react_agent(
+        model=llm,
+        tools=get_agent_tools(),
+        prompt=system_prompt,
+        checkpointer=checkpointer
+    )
+
+def build_small_agent_graph():
+    """Small-model agent for the cascade; no checkpointer, the turn is only persisted if accepted."""
+    if small_llm is None:
+        return None
+    return create_react_agent(
+        model=small_llm,
+        tools=get_agent_tools(),
+        prompt=system_prompt + cascade_confidence_prompt
+    )
+
+def rebuild_agent_graph():
+    # Rebuild khi một MCP server (re)connect, danh sách tool thay đổi hoặc checkpointer được mở
+    global agent_graph, stateless_agent_graph, small_agent_graph
+    agent_graph = build_agent_graph(session_store.checkpointer)
+    # Request stateless (batch) không có thread_id nên cần graph không có checkpointer
+    stateless_agent_graph = build_agent_graph() if session_store.enabled else agent_graph
+    small_agent_graph = build_small_agent_graph()
+
+# MCP servers are configured through MCP_SERVERS (see mcp_tools.py)
+mcp_tools = MCPToolManager.from_env(on_change=rebuild_agent_graph)
+# Optional persisted graph state per session (see session_state.py)
+session_store = SessionStateStore.from_env()
+rebuild_agent_graph()
+
+# Pre-router: gọi thẳng tool cho các câu hỏi rõ ràng, bỏ qua bước LLM chọn tool
+intent_router = IntentRouter.from_env(embedding_model, catalog=catalog)
+# Tool của router cũng đi qua budget: được đếm, có timeout và dùng chung cache của batch
+router_tools = {tool.name: tool for tool in budget.wrap_tools([get_product_semantic_tool, query_supabase])}
+
+async def answer_with_route(route: Route, messages: List) -> Optional[str]:
+    """
+    Run the routed tool directly and generate the answer in a single LLM call.
+
+    Returns None when the tool finds nothing usable, so the ReAct agent can handle the turn.
+    """
+    if route.kind == "semantic":
+        # route.query là câu hỏi gốc nên tool dùng lại embedding / retrieval đã prefetch
+        tool_name, args = "get_product_semantic_tool", {"query": route.query}
+    else:
+        tool_name, args = "query_supabase", {"sql_query": route.sql}
+    try:
+        tool_output = str(await router_tools[tool_name].ainvoke(args))
+    except Exception as e:
+        print(f"[ROUTER] {route.kind} tool failed, falling back to agent: {e}")
+        return None
+    # Lỗi của budget (hết lượt gọi, timeout) hoặc không có kết quả: để agent xử lý
+    if tool_output.startswith(("Error", "Không tìm thấy", "Lỗi truy vấn")):
+        return None
+    print(f"[ROUTER] {route.kind} -> {tool_name}")
+
+    # Chỉ giữ hội thoại dạng text (bỏ tool call/tool result nếu state đến từ checkpointer)
+    conversation = [
+        m for m in messages[:-1]
+        if isinstance(m, (HumanMessage, AIMessage)) and isinstance(m.content, str) and m.content
+    ]
+    prompt_messages = [
+        SystemMessage(content=system_prompt),
+        *conversation,
+        HumanMessage(content=(
+            f"{route.query}\n\n"
+            f"KẾT QUẢ TỪ {tool_name}:\n{tool_output}\n\n"
+            "Trả lời khách hàng dựa trên kết quả trên."
+        )),
+    ]
+    try:
+        response = await asyncio.wait_for(llm.ainvoke(prompt_messages), timeout=budget.remaining())
+        return response.content
+    except asyncio.TimeoutError:
+        # Hết budget: trả lời best-effort từ kết quả tool đã có, như vòng ReAct
+        print("[BUDGET] deadline hit during routed answer")
+        result = ToolMessage(content=tool_output, name=tool_name, tool_call_id="router")
+        return await budget.best_effort_answer(llm, conversation, messages[-1], [result])
 
 metadata_agent = create_react_agent(
     model=llm,
@@ -164,16 +265,19 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Security(security))
 
 # Database operations
 async def fetch_conversation_history(session_id: str, limit: int = 20) -> List[Dict[str, Any]]:
-    """Fetch conversation history from Supabase."""
+    """Fetch the latest `limit` messages of a session from Supabase, oldest first."""
     try:
-        response = supabase.table("chat_histories") \
-            .select("*") \
+        # Served by the (session_id, created_at DESC) index: reads only `limit` rows
+        query = supabase.table("chat_histories") \
+            .select("message, created_at") \
             .eq("session_id", session_id) \
-            .limit(limit) \
-            .execute()
+            .order("created_at", desc=True) \
+            .limit(limit)
+        # Client Supabase là sync: chạy trong thread để không chặn event loop
+        response = await asyncio.to_thread(query.execute)
         
         # Reverse to get chronological order
-        messages = response.data
+        messages = list(reversed(response.data))
         return messages
     except Exception as e:
         print(f"Error fetching conversation history: {e}")
@@ -192,13 +296,51 @@ async def store_message(session_id: str, message_type: str, content: str, data:
     if data:
         message_obj["data"] = data
     try:
-        supabase.table("chat_histories").insert({
+        query = supabase.table("chat_histories").insert({
             "session_id": session_id,
             "message": message_obj
-        }).execute()
+        })
+        await asyncio.to_thread(query.execute)
     except Exception as e:
         print(f"Error storing message: {e}")
 
+async def load_conversation(graph, session_id: str, chat_input: str):
+    """
+    Return (prior_messages, messages): the checkpointer state of the session, or,
+    when there is none, the history from chat_histories to seed the graph with.
+    """
+    if session_store.enabled:
+        # Với checkpointer, graph tiếp tục từ state đã lưu: chỉ cần gửi input mới
+        prior_messages = await session_store.get_messages(graph, session_id)
+        if prior_messages:
+            return prior_messages, []
+    # Fetch conversation history (cũng dùng để khởi tạo state lần đầu)
+    history = await fetch_conversation_history(session_id)
+    messages = []
+    for msg in history:  # Đảm bảo thứ tự từ cũ đến mới
+        msg_data = msg.get("message", {})
+        msg_type = msg_data.get("type")
+        msg_content = msg_data.get("content", "")
+        if msg_type == "human":
+            messages.append(HumanMessage(content=msg_content))
+        else:
+            messages.append(AIMessage(content=msg_content))
+    # Message của user được ghi song song nên có thể đã nằm trong history
+    if messages and isinstance(messages[-1], HumanMessage) and messages[-1].content == chat_input.strip():
+        messages.pop()
+    return [], messages
+
+async def embed_input(text: str, embedding: Optional[List[float]] = None) -> Optional[List[float]]:
+    """Speculatively embed the raw input for the router and get_product_semantic_tool."""
+    if embedding is not None:
+        # Đã embed sẵn theo batch
+        return embedding
+    try:
+        return await asyncio.to_thread(embedding_model.embed_query, text)
+    except Exception as e:
+        print(f"[PREFETCH] Embedding failed: {e}")
+        return None
+
 # Main endpoint
 @app.post("/invoke-python-agent", response_model=ChatResponse)
 async def invoke_agent(
@@ -206,65 +348,140 @@ async def invoke_agent(
     authenticated: bool = Depends(verify_token)
 ):
     """Main endpoint that handles chat requests with web search capability using LangGraph agent."""
+    result = await run_chat_turn(request)
+    return ChatResponse(output=result.output)
+
+@dataclass
+class TurnResult:
+    output: str
+    path: str  # "metadata" | "router" | "cascade" | "agent" | "error"
+    tool_calls: int
+
+async def run_chat_turn(
+    request: ChatRequest,
+    stateless: bool = False,
+    embedding: Optional[List[float]] = None,
+) -> TurnResult:
+    """
+    Answer one chat turn. Stateless turns skip the history, the checkpointer and
+    message storage; `embedding` is the precomputed embedding of chatInput, if any.
+    """
     # Check if this is a metadata request (starting with "### Task")
     if request.chatInput.startswith("### Task"):
         # For metadata requests, use the metadata agent without history
         messeges = [
             HumanMessage(content=request.chatInput)
         ]
-        result = await metadata_agent.ainvoke({"messages": messeges})
-        print(result["messages"][-1].content)
-        return ChatResponse(output=result["messages"][-1].content)
-    
+        budget.start()
+        result = await budget.bounded(metadata_agent.ainvoke({"messages": messeges}), stage="metadata task")
+        # Task metadata (tiêu đề, tag, ...) hết hạn thì trả chuỗi rỗng thay vì câu xin lỗi
+        output = result["messages"][-1].content if result is not None else ""
+        print(output)
+        return TurnResult(output=output, path="metadata", tool_calls=0)
+
+    store_human = None
+    if not stateless:
+        # Ghi message của user chạy nền, chỉ cần xong trước khi ghi câu trả lời
+        store_human = asyncio.create_task(store_message(
+            session_id=request.sessionId,
+            message_type="human",
+            content=request.chatInput
+        ))
+    state = budget.start()
+    path = "agent"
+    config = None
     try:
-        # Fetch conversation history
-        history = await fetch_conversation_history(request.sessionId)
-        messages = []
-        for msg in history:  # Đảm bảo thứ tự từ cũ đến mới
-            msg_data = msg.get("message", {})
-            msg_type = msg_data.get("type")
-            msg_content = msg_data.get("content", "")
-            if msg_type == "human":
-                messages.append(HumanMessage(content=msg_content))
-            else:
-                messages.append(AIMessage(content=msg_content))
+        small_graph = small_agent_graph
+        if stateless:
+            graph = stateless_agent_graph
+            config = None
+            prior_messages, messages = [], []
+            embedding = await budget.bounded(embed_input(request.chatInput, embedding), stage="embedding")
+        else:
+            graph = agent_graph
+            config = session_store.config(request.sessionId) if session_store.enabled else None
+            # Đọc lịch sử và embed câu hỏi song song với việc ghi message của user
+            (prior_messages, messages), embedding = await asyncio.gather(
+                budget.bounded(load_conversation(graph, request.sessionId, request.chatInput), ([], []), "history"),
+                budget.bounded(embed_input(request.chatInput, embedding), stage="embedding"),
+            )
+        prefetch = QueryPrefetch(request.chatInput, embedding)
+        if PREFETCH_RETRIEVAL:
+            prefetch.start_retrieval(lambda query, vector: get_product_semantic(query, embedding_model, vector))
+        prefetch.activate()
 
         # Thêm input mới nhất của user vào messages
         messages.append(HumanMessage(content=request.chatInput))
 
-        # Store user's message
-        await store_message(
-            session_id=request.sessionId,
-            message_type="human",
-            content=request.chatInput
-        )
-    
-        # Run LangGraph agent
-        result = await agent_graph.ainvoke(
-            {"messages": messages},
-        )
-        output = result["messages"][-1].content
+        # Các message mới của lượt này (không gồm state đã lưu)
+        new_messages = None
+        if intent_router is not None:
+            route = await budget.bounded(intent_router.route(
+                request.chatInput, embedding, has_context=bool(prior_messages) or len(messages) > 1
+            ), stage="routing")
+            if route is not None:
+                routed_output = await answer_with_route(route, prior_messages + messages)
+                if routed_output is not None:
+                    new_messages = messages + [AIMessage(content=routed_output)]
+                    path = "router"
+
+        if new_messages is None and small_graph is not None:
+            # Model nhỏ dùng tối đa một nửa thời gian còn lại, phần còn lại dành cho model lớn
+            result_messages = await cascade.run(
+                small_graph, prior_messages + messages, request.sessionId, timeout=budget.remaining() / 2
+            )
+            if result_messages is not None:
+                new_messages = result_messages[len(prior_messages):]
+                path = "cascade"
+
+        if new_messages is not None:
+            if config is not None:
+                # Ghi lượt này vào state để các lượt sau vẫn tiếp tục từ checkpointer
+                await graph.aupdate_state(config, {"messages": new_messages})
+            output = new_messages[-1].content
+        else:
+            # Run LangGraph agent; hết budget thì trả lời từ các kết quả đã có
+            result_messages = await budget.run(graph, messages, config, llm)
+            output = result_messages[-1].content
         print(output)
-        
-        # Store agent's response
-        await store_message(
-            session_id=request.sessionId,
-            message_type="ai",
-            content=output
-        )
-        
-        return ChatResponse(output=output)
     except Exception as e:
-        error_message = f"I encountered an error: {str(e)}"
-        
-        # Store error response
+        output = f"I encountered an error: {str(e)}"
+        path = "error"
+
+    if config is not None and path != "error":
+        # Dọn state chạy nền, lỗi chỉ được log, không ảnh hưởng câu trả lời
+        session_store.schedule_compact(graph, request.sessionId)
+
+    if store_human is not None:
+        # Store agent's response (or the error message)
+        await store_human
         await store_message(
             session_id=request.sessionId,
             message_type="ai",
-            content=error_message
+            content=output
         )
-        
-        return ChatResponse(output=error_message)
+    return TurnResult(output=output, path=path, tool_calls=state.tool_calls)
+
+def run_chat_batch(requests: List[ChatRequest], stateless: bool = True, concurrency: int = 4):
+    """Run many chat turns with shared input embeddings and tool caches (see batch.py)."""
+    return run_batch(
+        requests,
+        lambda request, embedding: run_chat_turn(request, stateless=stateless, embedding=embedding),
+        embedding_model.embed_documents,
+        concurrency=concurrency,
+    )
+
+@app.post("/invoke-python-agent/batch")
+async def invoke_agent_batch(
+    batch: BatchChatRequest,
+    authenticated: bool = Depends(verify_token)
+):
+    """Run many chat requests with bounded concurrency and stream one NDJSON line per finished request."""
+    async def lines():
+        async for record in run_chat_batch(batch.requests, batch.stateless, batch.concurrency):
+            yield json.dumps(record, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,166 @@
+"""
+Persistent MCP tool sessions for the agent.
+
+Connections are opened once at startup (FastAPI lifespan) and kept alive by a
+supervisor task per server. Discovered tools are cached and re-listed on a
+refresh interval. Sessions are pinged every few seconds, and right away when a
+tool call fails with anything other than a tool error; a dead session is
+reopened, and unreachable servers are retried with exponential backoff.
+"""
+
+import asyncio
+import json
+import os
+import time
+from typing import Callable, Dict, List, Optional
+
+from langchain_core.tools import BaseTool, StructuredTool, ToolException
+from langchain_mcp_adapters.client import MultiServerMCPClient
+from langchain_mcp_adapters.tools import load_mcp_tools
+
+
+class MCPToolManager:
+    def __init__(
+        self,
+        connections: Dict[str, dict],
+        refresh_interval: float = 300.0,
+        ping_interval: float = 15.0,
+        ping_timeout: float = 5.0,
+        initial_backoff: float = 1.0,
+        max_backoff: float = 60.0,
+        startup_timeout: float = 10.0,
+        on_change: Optional[Callable[[], None]] = None,
+    ):
+        self.connections = connections
+        self.refresh_interval = refresh_interval
+        self.ping_interval = ping_interval
+        self.ping_timeout = ping_timeout
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.startup_timeout = startup_timeout
+        self.on_change = on_change
+        self._tools: Dict[str, List[BaseTool]] = {}
+        self._signatures: Dict[str, tuple] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._first_attempt: Dict[str, asyncio.Event] = {}
+        # Đánh thức supervisor: khi dừng, hoặc khi một tool call gặp lỗi kết nối
+        self._wake: Dict[str, asyncio.Event] = {}
+        self._stopping: Optional[asyncio.Event] = None
+
+    @classmethod
+    def from_env(cls, on_change: Optional[Callable[[], None]] = None) -> "MCPToolManager":
+        """
+        Build the manager from MCP_SERVERS (JSON, same format as MultiServerMCPClient), e.g.
+        {"muse": {"url": "http://localhost:8001/mcp", "transport": "streamable_http"}}
+        """
+        raw = os.getenv("MCP_SERVERS", "").strip()
+        connections = json.loads(raw) if raw else {}
+        return cls(
+            connections,
+            refresh_interval=float(os.getenv("MCP_TOOLS_REFRESH_SECONDS", "300")),
+            ping_interval=float(os.getenv("MCP_PING_SECONDS", "15")),
+            max_backoff=float(os.getenv("MCP_MAX_BACKOFF_SECONDS", "60")),
+            on_change=on_change,
+        )
+
+    def get_tools(self) -> List[BaseTool]:
+        """Return the cached tools of every currently connected server."""
+        return [tool for name in self.connections for tool in self._tools.get(name, [])]
+
+    async def start(self):
+        """Open all sessions; waits up to startup_timeout for the first connection attempts."""
+        if not self.connections:
+            return
+        self._stopping = asyncio.Event()
+        client = MultiServerMCPClient(self.connections)
+        for name in self.connections:
+            self._first_attempt[name] = asyncio.Event()
+            self._wake[name] = asyncio.Event()
+            self._tasks.append(asyncio.create_task(self._supervise(client, name)))
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(event.wait() for event in self._first_attempt.values())),
+                timeout=self.startup_timeout,
+            )
+        except asyncio.TimeoutError:
+            print("[MCP] Some servers did not answer at startup, continuing in background")
+
+    async def stop(self):
+        if not self._tasks:
+            return
+        self._stopping.set()
+        for event in self._wake.values():
+            event.set()
+        # Cho các session tự đóng, chỉ cancel những task bị treo
+        _, pending = await asyncio.wait(self._tasks, timeout=5)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    def _set_tools(self, name: str, tools: List[BaseTool], session_id: int):
+        self._tools[name] = tools
+        signature = (session_id, tuple(sorted(tool.name for tool in tools)))
+        if self._signatures.get(name) != signature:
+            self._signatures[name] = signature
+            print(f"[MCP] {name}: {len(tools)} tools available")
+            if self.on_change:
+                self.on_change()
+
+    async def _sleep(self, name: str, timeout: float) -> bool:
+        """Sleep up to timeout or until woken; return True if the manager is stopping."""
+        try:
+            await asyncio.wait_for(self._wake[name].wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._wake[name].clear()
+        return self._stopping.is_set()
+
+    def _watch(self, name: str, tool: BaseTool) -> BaseTool:
+        """Same tool; a transport/session error wakes the supervisor to check the session."""
+
+        async def call(**kwargs):
+            try:
+                return await tool.ainvoke(kwargs)
+            except ToolException:
+                # Lỗi do tool trả về, session vẫn dùng được
+                raise
+            except Exception:
+                self._wake[name].set()
+                raise
+
+        return StructuredTool.from_function(
+            coroutine=call,
+            name=tool.name,
+            description=tool.description,
+            args_schema=tool.args_schema,
+        )
+
+    async def _supervise(self, client: MultiServerMCPClient, name: str):
+        backoff = self.initial_backoff
+        while not self._stopping.is_set():
+            try:
+                # Session được giữ mở trong task này; các tool dùng lại nó cho mọi request
+                async with client.session(name) as session:
+                    listed_at = float("-inf")
+                    while True:
+                        if time.monotonic() - listed_at >= self.refresh_interval:
+                            tools = await load_mcp_tools(session)
+                            self._set_tools(name, [self._watch(name, tool) for tool in tools], id(session))
+                            listed_at = time.monotonic()
+                            self._first_attempt[name].set()
+                            backoff = self.initial_backoff
+                        wait = min(self.ping_interval, self.refresh_interval - (time.monotonic() - listed_at))
+                        if await self._sleep(name, max(wait, 0)):
+                            return
+                        # Session chết (server restart, hết hạn) thì ping lỗi và session được mở lại
+                        await asyncio.wait_for(session.send_ping(), timeout=self.ping_timeout)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[MCP] {name} unavailable ({e}), retrying in {backoff:.0f}s")
+                self._set_tools(name, [], 0)
+                self._first_attempt[name].set()
+                if await self._sleep(name, backoff):
+                    return
+                backoff = min(backoff * 2, self.max_backoff)
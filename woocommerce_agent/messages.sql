@@ -7,5 +7,61 @@ CREATE TABLE chat_histories (
     message JSONB NOT NULL
 );
 
-CREATE INDEX idx_messages_session_id ON chat_histories(session_id);
-CREATE INDEX idx_messages_created_at ON chat_histories(created_at);
\ No newline at end of file
+-- "N tin nhắn mới nhất của một session": đọc thẳng từ index, không cần sort
+CREATE INDEX idx_messages_session_created_at ON chat_histories(session_id, created_at DESC);
+-- Dùng cho job retention (tìm các tin nhắn cũ)
+CREATE INDEX idx_messages_created_at ON chat_histories(created_at);
+
+-- Migration cho database đã tạo với index cũ:
+-- CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_messages_session_created_at ON chat_histories(session_id, created_at DESC);
+-- DROP INDEX CONCURRENTLY IF EXISTS idx_messages_session_id;
+
+-- Bảng lưu trữ các session không còn hoạt động
+CREATE TABLE chat_histories_archive (
+    id uuid PRIMARY KEY,
+    created_at TIMESTAMP WITH TIME ZONE,
+    session_id TEXT NOT NULL,
+    message JSONB NOT NULL,
+    archived_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX idx_messages_archive_session_created_at ON chat_histories_archive(session_id, created_at DESC);
+
+-- Chuyển tối đa batch_size session không có tin nhắn mới trong inactive_for sang bảng archive.
+-- Trả về số tin nhắn đã chuyển; gọi lặp lại cho đến khi trả về 0.
+CREATE OR REPLACE FUNCTION archive_chat_sessions(
+    inactive_for INTERVAL DEFAULT '90 days',
+    batch_size INT DEFAULT 500
+) RETURNS INT
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    cutoff TIMESTAMP WITH TIME ZONE := now() - inactive_for;
+    moved_count INT;
+BEGIN
+    WITH stale AS (
+        SELECT DISTINCT old.session_id
+        FROM chat_histories old
+        WHERE old.created_at < cutoff
+          AND NOT EXISTS (
+              SELECT 1 FROM chat_histories recent
+              WHERE recent.session_id = old.session_id
+                AND recent.created_at >= cutoff
+          )
+        LIMIT batch_size
+    ), moved AS (
+        DELETE FROM chat_histories h
+        USING stale
+        WHERE h.session_id = stale.session_id
+        RETURNING h.id, h.created_at, h.session_id, h.message
+    ), archived AS (
+        INSERT INTO chat_histories_archive (id, created_at, session_id, message)
+        SELECT id, created_at, session_id, message FROM moved
+        ON CONFLICT (id) DO NOTHING
+    )
+    -- Đếm số dòng đã xóa khỏi bảng chính (ROW_COUNT của INSERT bỏ qua các dòng trùng id)
+    SELECT count(*) INTO moved_count FROM moved;
+
+    RETURN moved_count;
+END;
+$$;
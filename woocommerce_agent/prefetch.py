@@ -0,0 +1,55 @@
+"""
+Speculative prefetch for the user's raw input.
+
+invoke_agent embeds the input while the history loads, and can optionally start
+the semantic retrieval for it in the background (PREFETCH_RETRIEVAL=true). When
+the agent's get_product_semantic_tool is called with the same query, it reuses
+the embedding or the retrieval result instead of computing them again.
+"""
+
+import os
+import re
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextvars import ContextVar
+from typing import Callable, List, Optional
+
+PREFETCH_RETRIEVAL = os.getenv("PREFETCH_RETRIEVAL", "false").lower() in ("1", "true", "yes")
+
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("PREFETCH_WORKERS", "4")), thread_name_prefix="prefetch"
+)
+
+# Prefetch của request hiện tại (tool chạy trong thread vẫn thấy nhờ context được copy)
+_current: ContextVar[Optional["QueryPrefetch"]] = ContextVar("query_prefetch", default=None)
+
+
+def normalize_query(query: str) -> str:
+    return re.sub(r"\s+", " ", query.lower()).strip(" ?!.,")
+
+
+class QueryPrefetch:
+    def __init__(self, query: str, embedding: Optional[List[float]]):
+        self.query = query
+        self.key = normalize_query(query)
+        self.embedding = embedding
+        self.retrieval: Optional[Future] = None
+
+    def matches(self, query: str) -> bool:
+        return normalize_query(query) == self.key
+
+    def start_retrieval(self, retrieve: Callable[[str, List[float]], str]):
+        """Run retrieve(query, embedding) in the background."""
+        if self.embedding is not None:
+            self.retrieval = _executor.submit(retrieve, self.query, self.embedding)
+
+    def activate(self):
+        """Make this prefetch visible to the tools of the current request."""
+        _current.set(self)
+
+
+def current_prefetch(query: str) -> Optional[QueryPrefetch]:
+    """The current request's prefetch if it was made for `query`."""
+    prefetch = _current.get()
+    if prefetch is not None and prefetch.matches(query):
+        return prefetch
+    return None
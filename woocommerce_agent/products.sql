@@ -40,3 +40,30 @@ begin
     limit match_count;
 end;
 $$;
+
+-- 4. Phiên bản catalog: tăng mỗi khi bảng products thay đổi,
+--    để agent biết khi nào cần tải lại snapshot trong bộ nhớ
+--
+-- Migration cho database đã tạo trước khi có catalog_meta: chạy riêng toàn bộ
+-- phần 4 này trong Supabase SQL editor (các lệnh đều chạy lại được). Khi chưa
+-- migrate, agent tải lại catalog mỗi CATALOG_UNVERSIONED_RELOAD_SECONDS.
+create table if not exists catalog_meta (
+  id int primary key default 1 check (id = 1),
+  version bigint not null default 0,
+  updated_at timestamptz not null default now()
+);
+
+insert into catalog_meta (id) values (1) on conflict do nothing;
+
+create or replace function bump_catalog_version()
+returns trigger language plpgsql as $$
+begin
+  update catalog_meta set version = version + 1, updated_at = now() where id = 1;
+  return null;
+end;
+$$;
+
+drop trigger if exists products_catalog_version on products;
+create trigger products_catalog_version
+after insert or update or delete or truncate on products
+for each statement execute function bump_catalog_version();
@@ -0,0 +1,221 @@
+# catalog.py
+"""
+Snapshot của bảng products trong bộ nhớ: tra cứu theo product_id / tên và các
+facet tính sẵn (số lượng theo loại, màu, RAM, bộ nhớ; khoảng giá theo loại).
+Snapshot được tải lại khi catalog_meta.version thay đổi (xem products.sql).
+Database chưa có catalog_meta thì snapshot được tải lại theo chu kỳ dài
+(CATALOG_UNVERSIONED_RELOAD_SECONDS).
+"""
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional
+
+try:
+    from .retrieval import client
+    from .formatting import clear_format_cache, format_products, format_value
+except ImportError:  # chạy trực tiếp trong thư mục retriever (run.py)
+    from retrieval import client
+    from formatting import clear_format_cache, format_products, format_value
+
+# Mốc histogram giá (triệu VNĐ)
+PRICE_BUCKETS = [0, 5, 10, 15, 20, 30, 50]
+
+
+def normalize_name(name: str) -> str:
+    name = str(name).replace("đ", "d").replace("Đ", "D")
+    name = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode("utf-8")
+    return re.sub(r"[^a-z0-9]+", " ", name.lower()).strip()
+
+
+BUCKET_LABELS = [f"{low}-{high} triệu" for low, high in zip(PRICE_BUCKETS, PRICE_BUCKETS[1:])] \
+    + [f"trên {PRICE_BUCKETS[-1]} triệu"]
+
+
+def _bucket_label(price: float) -> str:
+    millions = price / 1_000_000
+    for label, high in zip(BUCKET_LABELS, PRICE_BUCKETS[1:]):
+        if millions < high:
+            return label
+    return BUCKET_LABELS[-1]
+
+
+class CatalogSnapshot:
+    def __init__(self, client, check_interval: float = 30.0, unversioned_interval: float = 3600.0,
+                 page_size: int = 1000):
+        self.client = client
+        self.check_interval = check_interval
+        self.unversioned_interval = unversioned_interval
+        self.versioned = True
+        self.page_size = page_size
+        self.version: Optional[int] = None
+        self.by_id: Dict[str, Dict[str, Any]] = {}
+        self.by_name: Dict[str, List[Dict[str, Any]]] = {}
+        self.facets: Dict[str, Any] = {}
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _fetch_version(self) -> Optional[int]:
+        try:
+            response = self.client.table("catalog_meta").select("version").eq("id", 1).execute()
+            version = response.data[0]["version"] if response.data else None
+        except Exception as e:
+            version = None
+            error = e
+        else:
+            error = "no catalog_meta row"
+        if version is None:
+            # Database cũ chưa có catalog_meta: chỉ báo một lần, tải lại theo chu kỳ dài
+            if self.versioned:
+                print(
+                    f"[CATALOG] Cannot read catalog version ({error}); reloading every "
+                    f"{self.unversioned_interval:.0f}s. Run the catalog_meta migration in products.sql."
+                )
+            self.versioned = False
+            return None
+        self.versioned = True
+        return version
+
+    def _fetch_products(self) -> List[Dict[str, Any]]:
+        products, start = [], 0
+        while True:
+            response = self.client.table("products") \
+                .select("metadata") \
+                .order("id") \
+                .range(start, start + self.page_size - 1) \
+                .execute()
+            products.extend(row["metadata"] for row in response.data)
+            if len(response.data) < self.page_size:
+                return products
+            start += self.page_size
+
+    def load(self, products: List[Dict[str, Any]], version: Optional[int] = None):
+        by_id, by_name = {}, defaultdict(list)
+        counts = {"type": Counter(), "color": Counter(), "ram": Counter(), "storage": Counter()}
+        prices: Dict[str, List[float]] = defaultdict(list)
+        for product in products:
+            if product.get("product_id"):
+                by_id[str(product["product_id"])] = product
+            by_name[normalize_name(product.get("name", ""))].append(product)
+            for key, counter in counts.items():
+                if product.get(key) not in (None, "", 0):
+                    counter[product[key]] += 1
+            try:
+                prices[product.get("type") or "Khác"].append(float(product["price"]))
+            except (KeyError, TypeError, ValueError):
+                pass
+
+        price_facets = {}
+        for product_type, values in prices.items():
+            price_facets[product_type] = {
+                "min": min(values),
+                "max": max(values),
+                "histogram": Counter(_bucket_label(v) for v in values),
+            }
+        self.by_id, self.by_name = by_id, dict(by_name)
+        self.facets = {**counts, "price": price_facets, "total": len(products)}
+        self.version = version
+        clear_format_cache()
+        print(f"[CATALOG] Loaded {len(products)} products (version {version})")
+
+    def _is_recent(self) -> bool:
+        interval = self.check_interval if self.versioned else self.unversioned_interval
+        return bool(self.facets) and time.monotonic() - self._checked_at < interval
+
+    def ensure_fresh(self):
+        """Reload the snapshot if the catalog version changed (checked at most every check_interval)."""
+        if self._is_recent():
+            return
+        with self._lock:
+            if self._is_recent():
+                return
+            version = self._fetch_version()
+            if not self.facets or version is None or version != self.version:
+                self.load(self._fetch_products(), version)
+            self._checked_at = time.monotonic()
+
+    def lookup(self, query: str, limit: int = 5) -> List[Dict[str, Any]]:
+        """Find products by exact product_id, exact normalized name, then name containing all words."""
+        self.ensure_fresh()
+        query = query.strip()
+        if query in self.by_id:
+            return [self.by_id[query]]
+        upper = query.upper()
+        if upper in self.by_id:
+            return [self.by_id[upper]]
+        key = normalize_name(query)
+        if key in self.by_name:
+            return self.by_name[key][:limit]
+        tokens = key.split()
+        if not tokens:
+            return []
+        matches = [
+            product
+            for name, products in self.by_name.items()
+            if all(token in name.split() for token in tokens)
+            for product in products
+        ]
+        return matches[:limit]
+
+
+catalog = CatalogSnapshot(
+    client,
+    check_interval=float(os.getenv("CATALOG_VERSION_CHECK_SECONDS", "30")),
+    unversioned_interval=float(os.getenv("CATALOG_UNVERSIONED_RELOAD_SECONDS", "3600")),
+)
+
+
+def _format_counts(counter: Counter, key: str) -> str:
+    return ", ".join(f"{format_value(key, value)} ({count})" for value, count in counter.most_common())
+
+
+def get_catalog_facets(product_type: str = "") -> str:
+    """
+    Return an overview of the catalog: product counts per type, color, RAM and storage,
+    and the price range (min, max, histogram) per product type.
+
+    Args:
+        product_type (str): Optional product type (e.g. "Macbook", "Iphone", "IPad") to only show its price range.
+
+    Returns:
+        str: A formatted summary of the catalog facets.
+    """
+    catalog.ensure_fresh()
+    facets = catalog.facets
+    lines = [f"TỔNG SỐ SẢN PHẨM: {facets['total']}"]
+    if not product_type:
+        lines += [
+            f"- Loại: {_format_counts(facets['type'], 'type')}",
+            f"- Màu: {_format_counts(facets['color'], 'color')}",
+            f"- RAM: {_format_counts(facets['ram'], 'ram')}",
+            f"- Bộ nhớ: {_format_counts(facets['storage'], 'storage')}",
+        ]
+    for name, price in facets["price"].items():
+        if product_type and normalize_name(name) != normalize_name(product_type):
+            continue
+        histogram = ", ".join(
+            f"{label}: {price['histogram'][label]}" for label in BUCKET_LABELS if price["histogram"][label]
+        )
+        lines.append(
+            f"- Giá {name}: {format_value('price', price['min'])} - {format_value('price', price['max'])} ({histogram})"
+        )
+    return "\n".join(lines)
+
+
+def lookup_product(product_id_or_name: str) -> str:
+    """
+    Look up products by exact product_id (e.g. "IP14PR-1-P") or by name (e.g. "iphone 14 pro").
+
+    Args:
+        product_id_or_name (str): The product_id or (part of) the product name.
+
+    Returns:
+        str: A formatted string with the matching products' details.
+    """
+    products = catalog.lookup(product_id_or_name)
+    if not products:
+        return "Không tìm thấy sản phẩm phù hợp."
+    return format_products(products)
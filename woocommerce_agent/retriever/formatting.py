@@ -0,0 +1,138 @@
+# formatting.py
+"""
+Định dạng kết quả tool cho LLM: chỉ giữ các trường cần thiết, cắt ngắn mô tả
+và giới hạn tổng độ dài, vì output của tool đi thẳng vào prompt.
+"""
+import os
+from typing import Any, Dict, Iterable, List, Optional
+
+# Trường được giữ lại cho từng tool, theo thứ tự hiển thị
+SEMANTIC_FIELDS = ["product_id", "name", "type", "price", "ram", "storage", "color", "stock", "evaluate", "description", "image"]
+TABLE_FIELDS = ["product_id", "name", "type", "price", "ram", "storage", "color", "stock", "image"]
+# Trường dài bị bỏ khỏi bảng; mọi cột khác (alias, COUNT, AVG, ...) đều được giữ
+TABLE_DROPPED_FIELDS = {"description", "image"}
+
+DESCRIPTION_MAX_CHARS = int(os.getenv("TOOL_DESCRIPTION_MAX_CHARS", "300"))
+OUTPUT_MAX_CHARS = int(os.getenv("TOOL_OUTPUT_MAX_CHARS", "4000"))
+
+_FORMAT_CACHE: Dict[tuple, str] = {}
+_FORMAT_CACHE_SIZE = 4096
+
+
+def clear_format_cache():
+    """Drop precomputed product blocks (call when the catalog changes)."""
+    _FORMAT_CACHE.clear()
+
+
+def truncate(text: Any, max_chars: int) -> str:
+    """Cắt chuỗi tại ranh giới từ, thêm '...' nếu bị cắt."""
+    text = " ".join(str(text).split())
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars].rsplit(" ", 1)[0]
+    return cut + "..."
+
+
+def format_value(key: str, value: Any) -> str:
+    if value is None or value == "":
+        return "-"
+    if key == "price":
+        try:
+            return f"{float(value):,.0f}đ".replace(",", ".")
+        except (TypeError, ValueError):
+            return str(value)
+    if key in ("ram", "storage") and isinstance(value, (int, float)):
+        return f"{value:g}GB" if value else "-"
+    if key == "description":
+        return truncate(value, DESCRIPTION_MAX_CHARS)
+    return " ".join(str(value).split())
+
+
+def _cache_key(fields: List[str], row: Dict[str, Any]) -> Optional[tuple]:
+    product_id = row.get("product_id")
+    # Cột tính toán (COUNT, SUM, ...) không nằm trong key nên không cache
+    if product_id is None or any(field not in SEMANTIC_FIELDS for field in fields):
+        return None
+    # Giá và tồn kho thay đổi thường xuyên nhất nên nằm trong key
+    return (tuple(fields), product_id, row.get("price"), row.get("stock"))
+
+
+def format_product_block(metadata: Dict[str, Any], fields: List[str] = SEMANTIC_FIELDS) -> str:
+    """Một sản phẩm dạng 'key: value' mỗi dòng, chỉ với các trường được chọn."""
+    key = _cache_key(fields, metadata)
+    if key is not None and key in _FORMAT_CACHE:
+        return _FORMAT_CACHE[key]
+    text = "\n".join(
+        f"{field}: {format_value(field, metadata[field])}"
+        for field in fields
+        if field in metadata
+    )
+    if key is not None:
+        if len(_FORMAT_CACHE) >= _FORMAT_CACHE_SIZE:
+            _FORMAT_CACHE.clear()
+        _FORMAT_CACHE[key] = text
+    return text
+
+
+def _unwrap(row: Any) -> Any:
+    # SELECT metadata ... trả về {"metadata": {...}}: trải các trường của metadata ra,
+    # các cột khác được chọn cùng (alias, aggregate) vẫn giữ nguyên
+    if isinstance(row, dict) and isinstance(row.get("metadata"), dict):
+        extra = {key: value for key, value in row.items() if key != "metadata"}
+        return {**row["metadata"], **extra}
+    return row
+
+
+def _columns(rows: List[Dict[str, Any]], known: List[str], dropped=frozenset()) -> List[str]:
+    """Known product fields first (in display order), then every other selected column."""
+    seen = []
+    for row in rows:
+        for key in row:
+            if key not in seen:
+                seen.append(key)
+    preferred = [field for field in known if field in seen and field not in dropped]
+    others = [key for key in seen if key not in known and key not in dropped]
+    return preferred + others
+
+
+def _append_within_budget(lines: List[str], new_lines: Iterable[str], max_chars: int, unit: str) -> List[str]:
+    new_lines = list(new_lines)
+    used = sum(len(line) + 1 for line in lines)
+    for idx, line in enumerate(new_lines):
+        if used + len(line) + 1 > max_chars and idx > 0:
+            lines.append(f"... (còn {len(new_lines) - idx} {unit} khác, hãy lọc cụ thể hơn)")
+            break
+        lines.append(line)
+        used += len(line) + 1
+    return lines
+
+
+def format_products(products: List[Dict[str, Any]], max_chars: int = OUTPUT_MAX_CHARS) -> str:
+    """Định dạng kết quả get_product_semantic: khối ngắn cho mỗi sản phẩm."""
+    header = f"TÌM THẤY TỔNG CỘNG {len(products)} SẢN PHẨM"
+    blocks = (
+        f"\nSẢN PHẨM {idx+1}:\n{format_product_block(metadata)}"
+        for idx, metadata in enumerate(products)
+    )
+    return "\n".join(_append_within_budget([header], blocks, max_chars, "sản phẩm"))
+
+
+def format_rows(rows: List[Any], max_chars: int = OUTPUT_MAX_CHARS) -> str:
+    """Định dạng kết quả query_supabase: bảng gọn cho nhiều dòng, khối cho một dòng."""
+    rows = [_unwrap(row) for row in rows]
+    header = f"TÌM THẤY {len(rows)} KẾT QUẢ:"
+    dict_rows = [row for row in rows if isinstance(row, dict)]
+    if len(dict_rows) != len(rows):
+        # Kết quả vô hướng (vd. count, distinct) thì in thẳng
+        return "\n".join(_append_within_budget([header], (str(row) for row in rows), max_chars, "kết quả"))
+    if len(rows) == 1:
+        fields = _columns(rows, SEMANTIC_FIELDS)
+        return f"{header}\n{format_product_block(rows[0], fields)}"
+
+    columns = _columns(dict_rows, TABLE_FIELDS, TABLE_DROPPED_FIELDS)
+    lines = [header, " | ".join(columns)]
+    body = (
+        " | ".join(format_value(col, row.get(col)) for col in columns)
+        for row in dict_rows
+    )
+    return "\n".join(_append_within_budget(lines, body, max_chars, "kết quả"))
@@ -1,12 +1,52 @@
+"""
+Nạp catalog sản phẩm từ file Excel lên bảng products của Supabase.
+
+    python ingest_data.py meta_data_phone.xlsx --workers 4
+
+- Catalog đã tiền xử lý được cache dạng Parquet, key theo hash của file nguồn,
+  nên các lần chạy sau bỏ qua bước đọc Excel (chậm).
+- Với --workers > 1, embedding chạy trên một process pool: mỗi worker load model
+  gte một lần rồi xử lý các batch được chia.
+- Cuối mỗi lần chạy in thời gian của từng bước.
+"""
+import argparse
+import hashlib
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from typing import List, Optional
+
 import pandas as pd
 import numpy as np
 from langchain_core.documents import Document
 from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_community.vectorstores import SupabaseVectorStore
 from supabase.client import create_client
-import os
 from dotenv import load_dotenv
 
+EMBEDDING_MODEL_NAME = "Alibaba-NLP/gte-multilingual-base"
+# Tăng khi preprocess_data thay đổi để cache cũ không còn được dùng
+PREPROCESS_VERSION = 1
+
+STAGE_TIMINGS = []
+
+@contextmanager
+def stage(name):
+    """Time an ingest stage and record it for the final report."""
+    start = time.monotonic()
+    print(f"=== {name} ===")
+    try:
+        yield
+    finally:
+        STAGE_TIMINGS.append((name, time.monotonic() - start))
+
+def print_timings():
+    print("\nIngest timings:")
+    for name, seconds in STAGE_TIMINGS:
+        print(f"  {name:<24} {seconds:6.1f}s")
+    print(f"  {'total':<24} {sum(s for _, s in STAGE_TIMINGS):6.1f}s")
+
 def normalize_storage(value):
     value = str(value).strip().upper().replace(' ', '')
     if 'TB' in value:
@@ -54,32 +94,114 @@ def generate_product_content(row: pd.Series) -> str:
     ]
     return "\n".join(features)
 
-def load_to_supabase(excel_path: str):
-    # Đọc và tiền xử lý dữ liệu
-    df = pd.read_excel(excel_path)
-    df = preprocess_data(df)
-    
+def source_hash(path: str) -> str:
+    """Hash of the source sheet's bytes (plus the preprocessing version)."""
+    digest = hashlib.sha256(f"v{PREPROCESS_VERSION}:".encode())
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def load_catalog(excel_path: str, cache_dir: Optional[str] = None) -> pd.DataFrame:
+    """Read and preprocess the sheet, or load it from the Parquet cache if the sheet is unchanged."""
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(excel_path) or ".", ".catalog_cache")
+    stem = os.path.splitext(os.path.basename(excel_path))[0]
+    cache_path = os.path.join(cache_dir, f"{stem}-{source_hash(excel_path)[:16]}.parquet")
+    if os.path.exists(cache_path):
+        print(f"[CACHE] Dùng catalog đã xử lý: {cache_path}")
+        return pd.read_parquet(cache_path)
+
+    df = preprocess_data(pd.read_excel(excel_path))
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        df.to_parquet(cache_path, index=False)
+        print(f"[CACHE] Đã lưu catalog vào {cache_path}")
+    except Exception as e:
+        # Thiếu pyarrow hoặc cột có kiểu dữ liệu lẫn lộn: vẫn nạp bình thường, chỉ không cache
+        print(f"[CACHE] Không lưu được cache: {e}")
+    return df
+
+def _plain(value):
+    """numpy scalar -> Python value so the metadata is JSON serializable."""
+    return value.item() if isinstance(value, np.generic) else value
+
+def _to_int(value) -> int:
+    value = _plain(value)
+    if isinstance(value, (int, float)) and not pd.isna(value):
+        return int(value)
+    value = str(value).strip()
+    return int(value) if value.isdigit() else 0
+
+def build_documents(df: pd.DataFrame) -> List[Document]:
     docs = []
-    for _, row in df.iterrows():
+    for row in df.to_dict("records"):
         # Tạo nội dung semantic cho embedding
         content = generate_product_content(row)
-        
+
         # Tạo metadata với các trường filterable
         metadata = {
             "product_id": str(row["product_id"]),
             "name": row["name"],
             "type": row["type"],
-            "ram": int(row["ram"]) if row["ram"] and row["ram"].isdigit() else 0,
-            "storage": int(row["storage"]) if row["storage"] and row["storage"].isdigit() else 0,
+            "ram": _to_int(row["ram"]),
+            "storage": _to_int(row["storage"]),
             "price": float(row["price"]),
-            "stock": row["stock"],
+            "stock": _plain(row["stock"]),
             "color": row["color"],
             "image": row["image"],
             "description": row["description"],
             "evaluate": row["evaluate"],
         }
-        
+
         docs.append(Document(page_content=content, metadata=metadata))
+    return docs
+
+def load_embedding_model(device: Optional[str] = None) -> HuggingFaceEmbeddings:
+    import torch
+
+    if device is None:
+        device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    # Khởi tạo embedding model (tối ưu cho tiếng Việt)
+    return HuggingFaceEmbeddings(
+        model_name=EMBEDDING_MODEL_NAME,
+        model_kwargs={'device': device, 'trust_remote_code': True}
+    )
+
+# Model của từng worker trong process pool, load một lần trong initializer
+_worker_model = None
+
+def _init_worker(device: str, threads: int):
+    global _worker_model
+    import torch
+
+    # Chia đều core cho các worker, tránh mỗi worker dùng hết core của máy
+    torch.set_num_threads(threads)
+    _worker_model = load_embedding_model(device)
+
+def _embed_shard(texts: List[str]) -> List[List[float]]:
+    return _worker_model.embed_documents(texts)
+
+def embed_with_pool(texts: List[str], workers: int, batch_size: int, device: str = "cpu") -> List[List[float]]:
+    """Embed texts on a process pool; each worker loads the model once and embeds whole batches."""
+    shards = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    threads = max(1, (os.cpu_count() or workers) // workers)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(device, threads)) as pool:
+        # map giữ đúng thứ tự các shard
+        return [vector for vectors in pool.map(_embed_shard, shards) for vector in vectors]
+
+def load_to_supabase(
+    excel_path: str,
+    workers: int = 1,
+    batch_size: int = 64,
+    cache_dir: Optional[str] = None,
+    device: Optional[str] = None,
+):
+    # Đọc và tiền xử lý dữ liệu (hoặc lấy từ cache)
+    with stage("read catalog"):
+        df = load_catalog(excel_path, cache_dir)
+    with stage("build documents"):
+        docs = build_documents(df)
 
     # Kết nối Supabase
     load_dotenv()
@@ -88,24 +210,38 @@ def load_to_supabase(excel_path: str):
         supabase_key=os.getenv("SUPABASE_SERVICE_KEY")
     )
 
-    # Khởi tạo embedding model (tối ưu cho tiếng Việt)
-    embed = HuggingFaceEmbeddings(
-        model_name="Alibaba-NLP/gte-multilingual-base",
-        model_kwargs={'device':'cuda', 'trust_remote_code': True}
-    )
+    texts = [doc.page_content for doc in docs]
+    if workers > 1:
+        with stage(f"embed ({workers} workers)"):
+            # Node ingest chỉ có CPU: mặc định không chia GPU cho nhiều process
+            vectors = embed_with_pool(texts, workers, batch_size, device or "cpu")
+    else:
+        with stage("load model"):
+            embed = load_embedding_model(device)
+        with stage("embed"):
+            vectors = embed.embed_documents(texts)
+
+    # Tải dữ liệu lên Supabase (vector đã tính sẵn nên store không cần embedding model)
+    with stage("upload"):
+        vector_store = SupabaseVectorStore(
+            client=client,
+            embedding=None,
+            table_name="products",
+            query_name="match_documents"
+        )
+        vector_store.add_vectors(vectors, docs)
 
-    # Tải dữ liệu lên Supabase
-    vector_store = SupabaseVectorStore.from_documents(
-        documents=docs,
-        embedding=embed,
-        client=client,
-        table_name="products",
-        query_name="match_documents"
-    )
-    
     print(f"[SUCCESS] Đã nạp {len(docs)} sản phẩm lên Supabase")
-    print(f"[NOTE] Kích thước vector: {len(embed.embed_query('test'))} chiều")
+    print(f"[NOTE] Kích thước vector: {len(vectors[0]) if vectors else 0} chiều")
+    print_timings()
 
 if __name__ == "__main__":
-    load_to_supabase("meta_data_phone.xlsx")
-
+    parser = argparse.ArgumentParser(description="Nạp catalog sản phẩm từ Excel lên Supabase.")
+    parser.add_argument("excel_path", nargs="?", default="meta_data_phone.xlsx")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("INGEST_WORKERS", "1")),
+                        help="Số process embedding (1 = một process như trước)")
+    parser.add_argument("--batch-size", type=int, default=64, help="Số sản phẩm mỗi batch gửi cho worker")
+    parser.add_argument("--cache-dir", default=None, help="Thư mục cache Parquet (mặc định .catalog_cache cạnh file Excel)")
+    parser.add_argument("--device", default=None, help="cpu / cuda (mặc định: cpu khi dùng nhiều worker)")
+    args = parser.parse_args()
+    load_to_supabase(args.excel_path, args.workers, args.batch_size, args.cache_dir, args.device)
@@ -4,6 +4,10 @@ from langchain_community.embeddings import HuggingFaceEmbeddings
 from dotenv import load_dotenv
 import os
 from supabase.client import create_client
+try:
+    from .formatting import format_products, format_rows
+except ImportError:  # chạy trực tiếp trong thư mục retriever (run.py)
+    from formatting import format_products, format_rows
 load_dotenv()
 
 client = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_SERVICE_KEY"))
@@ -28,13 +32,8 @@ def query_supabase(sql_query):
         data = response.data
         if not data:
             return "Không tìm thấy kết quả phù hợp."
-        # Format kết quả đẹp cho LLM
-        output = f"TÌM THẤY {len(data)} KẾT QUẢ:\n"
-        for idx, row in enumerate(data):
-            output += f"\nKẾT QUẢ {idx+1}:\n"
-            for key, value in row.items():
-                output += f"- {key}: {value}\n"
-        return output
+        # Format gọn cho LLM: bảng cho nhiều dòng, bỏ các trường dài
+        return format_rows(data)
     else:
         return f"Lỗi truy vấn: {str(response.error)}"
 import os
@@ -59,13 +58,15 @@ def get_vector_retriever(embedding_model):
     )
     return vs.as_retriever(search_kwargs={"k":3})
 
-def get_product_semantic(query, embedding_model):
+def get_product_semantic(query, embedding_model, query_embedding=None):
     """
     Retrieve semantic information of products based on a query.
 
     Args:
         query (str): The search query to find relevant products.
         embedding_model: An instance of HuggingFaceEmbeddings.
+        query_embedding (list[float], optional): Embedding of `query` if it was
+            already computed, so the model is not run again.
 
     Returns:
         str: A formatted string summarizing the total number of products found 
@@ -73,11 +74,10 @@ def get_product_semantic(query, embedding_model):
     """
 
     retriever = get_vector_retriever(embedding_model)
-    docs_res = retriever.invoke(query)
-    total_docs = len(docs_res)
-    output = f"TÌM THẤY TỔNG CỘNG {total_docs} SẢN PHẨM"
-    for idx, doc in enumerate(docs_res):
-        output += f"\n\nSẢN PHẨM {idx+1}:\n"
-        metadata_str = "\n".join(f"{key}: {value}" for key, value in doc.metadata.items())
-        output += metadata_str
-    return output
+    if query_embedding is not None:
+        docs_res = retriever.vectorstore.similarity_search_by_vector(
+            query_embedding, **retriever.search_kwargs
+        )
+    else:
+        docs_res = retriever.invoke(query)
+    return format_products([doc.metadata for doc in docs_res])
@@ -0,0 +1,306 @@
+"""
+Intent pre-router in front of agent_graph.
+
+For requests where the right tool is obvious, the router picks it from pattern
+rules (numbers, units, prices) plus a nearest-centroid classifier over the query
+embedding, so the tool can be called directly and the LLM only has to write the
+answer. Anything ambiguous returns None and goes through the ReAct graph.
+
+Type and color filters use the values that actually exist in the catalog (from
+the catalog snapshot facets, see retriever/catalog.py), so a query is only
+routed when its filters can match something. Structured routes are skipped when
+the query names a model ("iPhone 15 Pro Max") that the filters cannot express.
+"""
+
+import asyncio
+import math
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+# Câu mẫu cho từng loại intent; centroid được tính một lần bằng embedding model
+PROTOTYPES = {
+    "semantic": [
+        "Điện thoại nào chụp ảnh đẹp?",
+        "Laptop nào chơi game mượt?",
+        "Máy tính văn phòng giá rẻ",
+        "máy chụp ảnh đẹp",
+        "điện thoại pin trâu dùng cả ngày",
+        "laptop mỏng nhẹ cho sinh viên",
+        "điện thoại cho người lớn tuổi",
+        "máy tính bảng để học online",
+    ],
+    "structured": [
+        "Điện thoại RAM 8GB giá dưới 10 triệu",
+        "Laptop Apple bộ nhớ 512GB",
+        "iPhone bộ nhớ 256GB",
+        "Sản phẩm màu đen còn hàng",
+        "laptop ram 16gb",
+        "điện thoại dưới 5 triệu",
+        "samsung 128GB màu xanh",
+        "iPhone 256GB",
+    ],
+    "other": [
+        "xin chào",
+        "cảm ơn em",
+        "so sánh hai sản phẩm trên giúp anh",
+        "cái thứ hai thì sao",
+        "cửa hàng ở đâu",
+        "chính sách bảo hành thế nào",
+        "đặt hàng như thế nào",
+        "nên chọn cái nào trong mấy cái em vừa gợi ý",
+    ],
+}
+
+# Từ chung chỉ loại sản phẩm -> các tên loại có thể gặp trong catalog
+PRODUCT_TYPES = [
+    (r"\b(laptop|macbook|máy tính xách tay)\b", ("laptop", "macbook")),
+    (r"\b(tablet|ipad|máy tính bảng)\b", ("tablet", "ipad")),
+    (r"\b(điện thoại|iphone)\b", ("điện thoại", "iphone", "phone")),
+]
+
+NAME_KEYWORDS = [
+    "iphone", "macbook", "ipad", "apple", "samsung", "xiaomi", "oppo", "vivo", "realme",
+    "asus", "dell", "hp", "lenovo", "acer", "msi", "nokia",
+]
+
+# Từ chỉ dòng máy; cùng với các token có chữ số (15, m3, 16e) là phần tên model
+MODEL_WORDS = {"pro", "max", "mini", "plus", "ultra", "air", "se", "lite", "fe", "note", "fold", "flip"}
+
+COLORS = ["đen", "trắng", "tím", "xanh", "vàng", "đỏ", "hồng", "bạc", "xám"]
+
+_UNIT_RE = re.compile(r"(\d+(?:[.,]\d+)?)\s*(gb|tb)\b")
+_RAM_RE = re.compile(r"\bram\s*(\d+)\s*gb\b|\b(\d+)\s*gb\s*ram\b")
+_PRICE_RANGE_RE = re.compile(r"\btừ\s*(\d+(?:[.,]\d+)?)\s*(?:triệu|tr)?\s*(?:đến|tới|-)\s*(\d+(?:[.,]\d+)?)\s*(?:triệu|tr|củ)\b")
+_PRICE_RE = re.compile(r"\b(dưới|trên|từ|khoảng|tầm|hơn)?\s*(\d+(?:[.,]\d+)?)\s*(?:triệu|tr|củ)\b")
+
+
+@dataclass
+class Route:
+    kind: str  # "semantic" | "structured"
+    query: str
+    embedding: List[float]
+    filters: Dict[str, object] = field(default_factory=dict)
+    sql: Optional[str] = None
+
+
+def _number(value: str) -> float:
+    return float(value.replace(",", "."))
+
+
+def _match_types(text: str, catalog_types: List[str]) -> Optional[List[str]]:
+    """
+    Catalog types meant by the query: [] if it names no type, None if it names a
+    type the catalog does not have (the filter could not match anything).
+    """
+    mentioned = [t for t in catalog_types if re.search(rf"\b{re.escape(t.lower())}\b", text)]
+    if mentioned:
+        return mentioned
+    for pattern, aliases in PRODUCT_TYPES:
+        if re.search(pattern, text):
+            return [t for t in catalog_types if t.lower() in aliases] or None
+    return []
+
+
+def _match_colors(text: str, catalog_colors: List[str]) -> Optional[List[str]]:
+    """Catalog colors meant by "màu ..."; same convention as _match_types."""
+    # Ưu tiên tên màu đầy đủ ("xanh dương"), sau đó màu gốc ("xanh" -> mọi sắc xanh)
+    full = [c for c in catalog_colors if re.search(rf"\bmàu\s+{re.escape(c.lower())}\b", text)]
+    if full:
+        return full
+    for color in COLORS:
+        if re.search(rf"\bmàu\s+{color}\b", text):
+            return [c for c in catalog_colors if c.lower().split()[0] == color] or None
+    return []
+
+
+def parse_filters(text: str, catalog_types: List[str] = (), catalog_colors: List[str] = ()) -> Optional[Dict[str, object]]:
+    """
+    Extract spec/price/color/brand constraints from a Vietnamese shopping query.
+
+    Returns None when the query asks for a type or color the catalog does not have.
+    """
+    text = text.lower()
+    filters: Dict[str, object] = {}
+
+    ram = _RAM_RE.search(text)
+    if ram:
+        filters["ram"] = int(ram.group(1) or ram.group(2))
+    for value, unit in _UNIT_RE.findall(text):
+        size = _number(value) * (1024 if unit == "tb" else 1)
+        if filters.get("ram") == size:
+            continue
+        # RAM hiếm khi vượt 32GB: số lớn hơn là bộ nhớ trong
+        if size >= 64 or "bộ nhớ" in text or "rom" in text:
+            filters["storage"] = int(size)
+
+    price_range = _PRICE_RANGE_RE.search(text)
+    if price_range:
+        filters["price_min"] = _number(price_range.group(1)) * 1_000_000
+        filters["price_max"] = _number(price_range.group(2)) * 1_000_000
+    else:
+        price = _PRICE_RE.search(text)
+        if price:
+            amount = _number(price.group(2)) * 1_000_000
+            qualifier = price.group(1)
+            if qualifier == "dưới":
+                filters["price_max"] = amount
+            elif qualifier in ("trên", "từ", "hơn"):
+                filters["price_min"] = amount
+            else:
+                filters["price_min"] = amount * 0.9
+                filters["price_max"] = amount * 1.1
+
+    types = _match_types(text, list(catalog_types))
+    colors = _match_colors(text, list(catalog_colors))
+    if types is None or colors is None:
+        return None
+    if types:
+        filters["type"] = types
+    if colors:
+        filters["color"] = colors
+    for keyword in NAME_KEYWORDS:
+        if re.search(rf"\b{keyword}\b", text):
+            filters["name"] = keyword
+            break
+    return filters
+
+
+def unparsed_model_tokens(text: str) -> List[str]:
+    """Model tokens left after removing the specs and prices that parse_filters understands."""
+    rest = text.lower()
+    for pattern in (_RAM_RE, _UNIT_RE, _PRICE_RANGE_RE, _PRICE_RE):
+        rest = pattern.sub(" ", rest)
+    return [t for t in re.findall(r"\w+", rest) if t in MODEL_WORDS or any(c.isdigit() for c in t)]
+
+
+def has_spec_constraint(filters: Dict[str, object]) -> bool:
+    return any(key in filters for key in ("ram", "storage", "price_min", "price_max", "color"))
+
+
+def _sql_list(values: List[str]) -> str:
+    return ", ".join("'" + str(value).replace("'", "''") + "'" for value in values)
+
+
+def build_filter_sql(filters: Dict[str, object], limit: int = 5) -> str:
+    """SQL in the same shape as the prompt examples; values come only from parse_filters and the catalog."""
+    conditions = []
+    if "type" in filters:
+        conditions.append(f"(metadata->>'type') IN ({_sql_list(filters['type'])})")
+    if "name" in filters:
+        conditions.append(f"(metadata->>'name') ILIKE '%{filters['name']}%'")
+    if "ram" in filters:
+        conditions.append(f"(metadata->>'ram')::int >= {int(filters['ram'])}")
+    if "storage" in filters:
+        conditions.append(f"(metadata->>'storage')::int = {int(filters['storage'])}")
+    if "price_min" in filters:
+        conditions.append(f"(metadata->>'price')::float >= {float(filters['price_min']):.0f}")
+    if "price_max" in filters:
+        conditions.append(f"(metadata->>'price')::float <= {float(filters['price_max']):.0f}")
+    if "color" in filters:
+        conditions.append(f"(metadata->>'color') IN ({_sql_list(filters['color'])})")
+    where = " AND ".join(conditions) or "TRUE"
+    return (
+        f"SELECT metadata FROM products WHERE {where} "
+        f"ORDER BY (metadata->>'price')::float LIMIT {limit}"
+    )
+
+
+def _normalize(vector: List[float]) -> List[float]:
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+def _dot(a: List[float], b: List[float]) -> float:
+    return sum(x * y for x, y in zip(a, b))
+
+
+class IntentRouter:
+    def __init__(self, embedding_model, catalog=None, min_similarity: float = 0.5, min_margin: float = 0.03):
+        self.embedding_model = embedding_model
+        # CatalogSnapshot: nguồn các giá trị type/color có thật trong catalog
+        self.catalog = catalog
+        self.min_similarity = min_similarity
+        self.min_margin = min_margin
+        self._centroids: Optional[Dict[str, List[float]]] = None
+        self._lock = asyncio.Lock()
+
+    @classmethod
+    def from_env(cls, embedding_model, catalog=None) -> Optional["IntentRouter"]:
+        # Tắt mặc định cho đến khi ngưỡng được tinh chỉnh trên dữ liệu thật
+        if os.getenv("INTENT_ROUTER_ENABLED", "false").lower() not in ("1", "true", "yes"):
+            return None
+        return cls(
+            embedding_model,
+            catalog=catalog,
+            min_similarity=float(os.getenv("ROUTER_MIN_SIMILARITY", "0.5")),
+            min_margin=float(os.getenv("ROUTER_MIN_MARGIN", "0.03")),
+        )
+
+    async def _get_centroids(self) -> Dict[str, List[float]]:
+        if self._centroids is None:
+            async with self._lock:
+                if self._centroids is None:
+                    centroids = {}
+                    for label, examples in PROTOTYPES.items():
+                        vectors = await asyncio.to_thread(self.embedding_model.embed_documents, examples)
+                        mean = [sum(col) / len(vectors) for col in zip(*vectors)]
+                        centroids[label] = _normalize(mean)
+                    self._centroids = centroids
+        return self._centroids
+
+    async def classify(self, embedding: List[float]) -> Dict[str, float]:
+        """Cosine similarity of the query to each intent centroid."""
+        centroids = await self._get_centroids()
+        query = _normalize(embedding)
+        return {label: _dot(query, centroid) for label, centroid in centroids.items()}
+
+    async def _catalog_values(self):
+        if self.catalog is None:
+            return [], []
+        await asyncio.to_thread(self.catalog.ensure_fresh)
+        facets = self.catalog.facets
+        return list(facets.get("type", {})), list(facets.get("color", {}))
+
+    async def route(self, text: str, embedding: Optional[List[float]] = None,
+                    has_context: bool = False) -> Optional[Route]:
+        """
+        Return a confident Route for the query, or None to fall through to the agent.
+
+        has_context: the session already has earlier turns. A follow-up without a
+        product type or name ("còn bản 256GB không?") refers to the product being
+        discussed, so it is left to the agent.
+
+        The router is optional: any error (embedding, catalog reload) is logged and
+        the turn goes to the agent.
+        """
+        try:
+            return await self._route(text, embedding, has_context)
+        except Exception as e:
+            print(f"[ROUTER] Routing failed, falling back to agent: {e}")
+            return None
+
+    async def _route(self, text: str, embedding: Optional[List[float]], has_context: bool) -> Optional[Route]:
+        if embedding is None:
+            embedding = await asyncio.to_thread(self.embedding_model.embed_query, text)
+        scores = await self.classify(embedding)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        (label, best), (_, second) = ranked[0], ranked[1]
+        if label == "other" or best < self.min_similarity or best - second < self.min_margin:
+            return None
+
+        catalog_types, catalog_colors = await self._catalog_values()
+        filters = parse_filters(text, catalog_types, catalog_colors)
+        if filters is None:
+            return None
+        if has_context and "type" not in filters and "name" not in filters:
+            return None
+        if label == "structured" and has_spec_constraint(filters):
+            # "iPhone 15 Pro Max 1TB": lọc theo name/storage sẽ trả về iPhone 1TB của mọi đời máy
+            if unparsed_model_tokens(text):
+                return None
+            return Route("structured", text, embedding, filters, build_filter_sql(filters))
+        if label == "semantic" and not has_spec_constraint(filters):
+            return Route("semantic", text, embedding, filters)
+        return None
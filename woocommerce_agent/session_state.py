@@ -0,0 +1,228 @@
+"""
+Optional LangGraph checkpointer for per-session agent state.
+
+With a checkpointer the graph resumes from its persisted state (including tool
+calls and tool results) keyed by sessionId, instead of rebuilding the message
+list from chat_histories on every turn.
+
+Storage stays bounded: after a turn the message list is trimmed and every
+checkpoint of the thread except the latest is deleted, in a background task at
+most once per AGENT_STATE_COMPACT_SECONDS per session; threads whose latest
+checkpoint is older than the TTL are removed.
+"""
+
+import asyncio
+import os
+import time
+import uuid
+from contextlib import AsyncExitStack
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from langchain_core.messages import HumanMessage, RemoveMessage
+
+
+def checkpoint_id_at(moment: datetime) -> str:
+    """
+    Smallest checkpoint id LangGraph can generate at `moment`.
+
+    Checkpoint ids are uuid6 (timestamp first), so comparing them as strings
+    compares their creation times.
+    """
+    timestamp = int(moment.timestamp() * 10_000_000) + 0x01B21DD213814000
+    value = ((timestamp >> 12) & 0xFFFFFFFFFFFF) << 80
+    value |= 6 << 76  # version
+    value |= (timestamp & 0x0FFF) << 64
+    value |= 0b10 << 62  # variant
+    return str(uuid.UUID(int=value))
+
+
+# Bảng dữ liệu của từng checkpointer (bảng writes, bảng blobs nếu có)
+_WRITES_TABLE = {"sqlite": "writes", "postgres": "checkpoint_writes"}
+
+
+class SessionStateStore:
+    def __init__(
+        self,
+        backend: str = "none",
+        sqlite_path: str = "checkpoints.sqlite",
+        postgres_url: Optional[str] = None,
+        max_messages: int = 40,
+        ttl_seconds: float = 7 * 24 * 3600,
+        cleanup_interval: float = 3600,
+        compact_interval: float = 60,
+    ):
+        self.backend = backend
+        self.sqlite_path = sqlite_path
+        self.postgres_url = postgres_url
+        self.max_messages = max_messages
+        self.ttl_seconds = ttl_seconds
+        self.cleanup_interval = cleanup_interval
+        self.compact_interval = compact_interval
+        self.checkpointer = None
+        self._stack: Optional[AsyncExitStack] = None
+        self._cleanup_task: Optional[asyncio.Task] = None
+        self._compactions: Dict[str, asyncio.Task] = {}
+        self._compacted_at: Dict[str, float] = {}
+
+    @classmethod
+    def from_env(cls) -> "SessionStateStore":
+        return cls(
+            backend=os.getenv("AGENT_CHECKPOINTER", "none").lower(),
+            sqlite_path=os.getenv("AGENT_CHECKPOINT_SQLITE_PATH", "checkpoints.sqlite"),
+            postgres_url=os.getenv("AGENT_CHECKPOINT_POSTGRES_URL"),
+            max_messages=int(os.getenv("AGENT_STATE_MAX_MESSAGES", "40")),
+            ttl_seconds=float(os.getenv("AGENT_STATE_TTL_SECONDS", str(7 * 24 * 3600))),
+            compact_interval=float(os.getenv("AGENT_STATE_COMPACT_SECONDS", "60")),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.checkpointer is not None
+
+    async def start(self):
+        if self.backend in ("", "none"):
+            return
+        self._stack = AsyncExitStack()
+        if self.backend == "sqlite":
+            from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+            self.checkpointer = await self._stack.enter_async_context(
+                AsyncSqliteSaver.from_conn_string(self.sqlite_path)
+            )
+        elif self.backend == "postgres":
+            from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+            self.checkpointer = await self._stack.enter_async_context(
+                AsyncPostgresSaver.from_conn_string(self.postgres_url)
+            )
+        else:
+            raise ValueError(f"Unknown AGENT_CHECKPOINTER backend: {self.backend}")
+        await self.checkpointer.setup()
+        self._cleanup_task = asyncio.create_task(self._cleanup_loop())
+        print(f"[STATE] Using {self.backend} checkpointer")
+
+    async def stop(self):
+        if self._cleanup_task is not None:
+            self._cleanup_task.cancel()
+            await asyncio.gather(self._cleanup_task, return_exceptions=True)
+        compactions = list(self._compactions.values())
+        for task in compactions:
+            task.cancel()
+        await asyncio.gather(*compactions, return_exceptions=True)
+        if self._stack is not None:
+            await self._stack.aclose()
+        self.checkpointer = None
+
+    @staticmethod
+    def config(session_id: str) -> dict:
+        return {"configurable": {"thread_id": session_id}}
+
+    async def get_messages(self, graph, session_id: str) -> list:
+        """Messages persisted for the session (empty if it has no state yet)."""
+        state = await graph.aget_state(self.config(session_id))
+        return state.values.get("messages", [])
+
+    async def _execute(self, sql: str, params: tuple = (), fetch: bool = False) -> List[tuple]:
+        """Run SQL on the checkpointer's own connection ('?' placeholders)."""
+        if self.backend == "sqlite":
+            async with self.checkpointer.lock:
+                cursor = await self.checkpointer.conn.execute(sql, params)
+                rows = await cursor.fetchall() if fetch else []
+                await self.checkpointer.conn.commit()
+                return rows
+        async with self.checkpointer.conn.cursor() as cursor:
+            await cursor.execute(sql.replace("?", "%s"), params)
+            return await cursor.fetchall() if fetch else []
+
+    def schedule_compact(self, graph, session_id: str):
+        """
+        Compact the session in the background, at most once per compact_interval.
+
+        Called after each turn; never delays or fails the turn itself.
+        """
+        now = time.monotonic()
+        if session_id in self._compactions:
+            return
+        if now - self._compacted_at.get(session_id, float("-inf")) < self.compact_interval:
+            return
+        if len(self._compacted_at) > 10_000:
+            # Bỏ các session đã hết thời gian chờ để dict không lớn mãi
+            self._compacted_at = {
+                sid: at for sid, at in self._compacted_at.items() if now - at < self.compact_interval
+            }
+        self._compacted_at[session_id] = now
+        task = asyncio.create_task(self._compact_in_background(graph, session_id))
+        self._compactions[session_id] = task
+        task.add_done_callback(lambda _: self._compactions.pop(session_id, None))
+
+    async def _compact_in_background(self, graph, session_id: str):
+        try:
+            await self.compact(graph, session_id)
+        except Exception as e:
+            print(f"[STATE] Compaction failed for {session_id}: {e}")
+
+    async def compact(self, graph, session_id: str):
+        """Bound the message list, then drop older checkpoints."""
+        await self.trim(graph, session_id)
+        await self.prune(session_id)
+
+    async def prune(self, session_id: str):
+        """Delete every checkpoint (and its pending writes) of the thread except the latest."""
+        latest = "(SELECT MAX(checkpoint_id) FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = '')"
+        await self._execute(
+            f"DELETE FROM {_WRITES_TABLE[self.backend]} "
+            f"WHERE thread_id = ? AND checkpoint_ns = '' AND checkpoint_id < {latest}",
+            (session_id, session_id),
+        )
+        await self._execute(
+            f"DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = '' AND checkpoint_id < {latest}",
+            (session_id, session_id),
+        )
+        if self.backend == "postgres":
+            # Blob của các version channel không còn checkpoint nào tham chiếu
+            await self._execute(
+                "DELETE FROM checkpoint_blobs b WHERE b.thread_id = ? AND NOT EXISTS ("
+                " SELECT 1 FROM checkpoints c, jsonb_each_text(c.checkpoint->'channel_versions') v"
+                " WHERE c.thread_id = b.thread_id AND c.checkpoint_ns = b.checkpoint_ns"
+                " AND v.key = b.channel AND v.value = b.version)",
+                (session_id,),
+            )
+
+    async def trim(self, graph, session_id: str):
+        """Keep at most max_messages, cutting at a human turn so no tool call loses its result."""
+        config = self.config(session_id)
+        state = await graph.aget_state(config)
+        messages = state.values.get("messages", [])
+        if len(messages) <= self.max_messages:
+            return
+        cut = len(messages) - self.max_messages
+        while cut < len(messages) and not isinstance(messages[cut], HumanMessage):
+            cut += 1
+        if cut >= len(messages):
+            return
+        await graph.aupdate_state(
+            config, {"messages": [RemoveMessage(id=m.id) for m in messages[:cut]]}
+        )
+
+    async def cleanup_expired(self) -> int:
+        """Delete the state of sessions whose latest checkpoint is older than ttl_seconds."""
+        cutoff = checkpoint_id_at(datetime.now(timezone.utc) - timedelta(seconds=self.ttl_seconds))
+        # Chỉ đọc checkpoint_id (đã có index theo thread_id), không deserialize checkpoint
+        rows = await self._execute(
+            "SELECT thread_id FROM checkpoints WHERE checkpoint_ns = '' "
+            "GROUP BY thread_id HAVING MAX(checkpoint_id) < ?",
+            (cutoff,),
+            fetch=True,
+        )
+        for (thread_id,) in rows:
+            await self.checkpointer.adelete_thread(thread_id)
+        return len(rows)
+
+    async def _cleanup_loop(self):
+        while True:
+            try:
+                removed = await self.cleanup_expired()
+                if removed:
+                    print(f"[STATE] Removed {removed} expired sessions")
+            except Exception as e:
+                print(f"[STATE] Cleanup failed: {e}")
+            await asyncio.sleep(self.cleanup_interval)